@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Бэкенды, данные которых не видны другим процессам.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш должен быть общим для всех воркеров gunicorn.
+
+    С кэшем в памяти процесса лимиты запросов умножаются на число
+    воркеров, привязка чтений к основной БД после записи и
+    дедупликация событий рейтинга не работают, а сброс кэша
+    справочников виден только одному воркеру. Проверка выполняется
+    перед запуском gunicorn (check --deploy в run_app.sh), поэтому
+    makemigrations и тесты без общего кэша не блокируются.
+    """
+    if settings.DEBUG:
+        return []
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Error(
+        f'Кэш {backend} не общий для воркеров.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION, например '
+             'django.core.cache.backends.redis.RedisCache и '
+             'redis://cache:6379/0.',
+        id='api.E001',
+    )]
@@ -0,0 +1,51 @@
+"""Сжатие JSON-ответов gzip и Brotli."""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IDENTITY = 'identity'
+ACCEPT_BROTLI = re.compile(r'\bbr\b')
+ACCEPT_GZIP = re.compile(r'\bgzip\b')
+
+
+def select_encoding(request):
+    """Лучшее из поддерживаемых клиентом сжатий."""
+    accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if brotli is not None and ACCEPT_BROTLI.search(accept_encoding):
+        return 'br'
+    if ACCEPT_GZIP.search(accept_encoding):
+        return 'gzip'
+    return IDENTITY
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.BROTLI_QUALITY)
+    return compress_string(content)
+
+
+def precompress(content):
+    """Тело ответа во всех доступных кодировках для хранения в кэше."""
+    encoded = {IDENTITY: content}
+    if len(content) >= settings.COMPRESSION_MIN_SIZE:
+        encoded['gzip'] = compress(content, 'gzip')
+        if brotli is not None:
+            encoded['br'] = compress(content, 'br')
+    return encoded
+
+
+def apply_encoding(response, content, encoding):
+    """Подставляет в ответ тело и заголовки выбранной кодировки."""
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response.content = content
+    response['Content-Length'] = str(len(content))
+    if encoding != IDENTITY:
+        response['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,54 @@
+"""Отдача сгенерированных файлов через nginx."""
+import hashlib
+import io
+import os
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header
+
+
+def spool(content):
+    """Кладёт байты в SPOOL_ROOT и возвращает их путь внутри него.
+
+    Имя файла - хэш содержимого: одинаковые выгрузки не копятся,
+    а повторная выгрузка продлевает жизнь файла до очистки
+    командой clean_spool.
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    name = f'{digest[:2]}/{digest}'
+    path = os.path.join(settings.SPOOL_ROOT, name)
+    if os.path.exists(path):
+        os.utime(path)
+        return name
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+    return name
+
+
+def deliver_file(content, filename, content_type):
+    """Ответ с файлом для скачивания.
+
+    С USE_X_ACCEL_REDIRECT воркер только пишет файл в spool и сразу
+    освобождается, а отдачу медленному клиенту берёт на себя nginx
+    из internal-локации SPOOL_URL. Без него (в разработке) файл
+    отдаётся самим Django.
+    """
+    if not settings.USE_X_ACCEL_REDIRECT:
+        return FileResponse(
+            io.BytesIO(content),
+            as_attachment=True,
+            filename=filename,
+            content_type=content_type
+        )
+    response = HttpResponse(content_type=content_type)
+    response['Content-Disposition'] = content_disposition_header(
+        True,
+        filename
+    )
+    response['X-Accel-Redirect'] = settings.SPOOL_URL + spool(content)
+    return response
@@ -1,6 +1,15 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Lower
 from django_filters import rest_framework as filters
 
+from foodgram.constants import (FEED_FOLLOWING,
+                                TRENDING,
+                                USER_SEARCH_MIN_LENGTH)
 from recipes.models import Ingredient, Recipe
+from users.models import Subscribe, User
 
 
 class IngredientsFilterSet(filters.filterset.FilterSet):
@@ -13,18 +22,71 @@ class IngredientsFilterSet(filters.filterset.FilterSet):
         fields = ('name',)
 
 
+class UsersFilterSet(filters.filterset.FilterSet):
+    """Фильтрсет для поиска пользователей."""
+
+    search_fields = ('username', 'first_name', 'last_name', 'email')
+    search = filters.CharFilter(
+        method='filter_search',
+        min_length=USER_SEARCH_MIN_LENGTH
+    )
+
+    class Meta:
+        model = User
+        fields = ('search',)
+
+    def filter_search(self, queryset, name, value):
+        """Подстрока в любом из полей без учёта регистра.
+
+        Условие LOWER(поле) LIKE '%value%' совпадает с выражением
+        триграммных индексов users_user_*_trgm_idx в PostgreSQL.
+        """
+        value = value.lower()
+        return queryset.alias(**{
+            f'{field}_lower': Lower(field) for field in self.search_fields
+        }).filter(reduce(or_, (
+            Q(**{f'{field}_lower__contains': value})
+            for field in self.search_fields
+        )))
+
+
 class RecipeFilterSet(filters.filterset.FilterSet):
     """Фильтрсет для рецептов."""
 
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
-    )
+    tags = filters.CharFilter(method='filter_tags')
     is_favorited = filters.BooleanFilter(method='filter_favorite')
     is_in_shopping_cart = filters.BooleanFilter(method='filter_shopping_cart')
+    feed = filters.ChoiceFilter(
+        choices=((FEED_FOLLOWING, FEED_FOLLOWING),),
+        method='filter_feed'
+    )
+    cooking_time = filters.RangeFilter()
+    ordering = filters.CharFilter(method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author',
+            'tags',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'feed',
+            'cooking_time',
+            'ordering',
+        )
+
+    def filter_tags(self, queryset, name, value):
+        """Рецепты с любым из тэгов ?tags=<slug>&tags=<slug>.
+
+        Неизвестный slug не ошибка: он просто ничего не находит.
+        Условие - EXISTS по таблице связей, без DISTINCT по рецептам.
+        """
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag__slug__in=self.data.getlist(name)
+            )
+        ))
 
     def filter_favorite(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -35,3 +97,36 @@ class RecipeFilterSet(filters.filterset.FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shoppingcart__user=self.request.user)
         return queryset
+
+    def filter_feed(self, queryset, name, value):
+        """Рецепты авторов, на которых подписан пользователь.
+
+        Подписки подставляются подзапросом author_id IN (...),
+        чтобы лента собиралась одним запросом по индексу (author, created).
+        У анонимного пользователя подписок нет, и лента пуста.
+        """
+        if value != FEED_FOLLOWING:
+            return queryset
+        if not self.request.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(
+            author_id__in=Subscribe.objects.filter(
+                user=self.request.user
+            ).values('author_id')
+        )
+
+    def filter_ordering(self, queryset, name, value):
+        """Популярные рецепты по рейтингу RecipeScore.
+
+        Рейтинг ведётся по событиям, поэтому выдача не группирует
+        таблицы избранного и корзины. Рецепты без единого события
+        идут после оценённых, от новых к старым. Лента подписок
+        всегда идёт по дате публикации: на ней работает курсор
+        FeedPaginator. Другие значения ordering не меняют порядок.
+        """
+        if value != TRENDING or self.data.get('feed') == FEED_FOLLOWING:
+            return queryset
+        return queryset.order_by(
+            F('score__score').desc(nulls_last=True),
+            '-pk'
+        )
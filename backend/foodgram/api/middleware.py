@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from api.compression import IDENTITY, compress, select_encoding
+
+
+class CompressionMiddleware:
+    """Сжатие JSON-ответов API в Brotli или gzip.
+
+    Ответы меньше COMPRESSION_MIN_SIZE и уже сжатые ответы
+    (например, готовые байты из кэша справочников) не трогаются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming
+                or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith(
+                    'application/json'
+                )):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        encoding = select_encoding(request)
+        if encoding == IDENTITY:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
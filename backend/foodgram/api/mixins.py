@@ -0,0 +1,193 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.functional import cached_property
+from django.utils.http import parse_etags
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.status import HTTP_200_OK, HTTP_304_NOT_MODIFIED
+
+from api.compression import (IDENTITY,
+                             apply_encoding,
+                             precompress,
+                             select_encoding)
+from foodgram.cache import reference_cache_key
+from foodgram.db_router import enable_replica_reads, reset_replica_reads
+
+
+class ReplicaReadMixin:
+    """Выполняет безопасные запросы вьюсета на репликах БД.
+
+    После собственной записи пользователь на REPLICA_PIN_SECONDS
+    закрепляется за основной БД, чтобы сразу видеть свои изменения
+    (избранное, корзину, подписки), несмотря на задержку репликации.
+    """
+
+    @staticmethod
+    def _pin_key(user):
+        return f'replica_pin:{user.pk}'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if (request.method in SAFE_METHODS
+                and settings.DATABASE_REPLICAS
+                and not (user.is_authenticated
+                         and cache.get(self._pin_key(user)))):
+            self._replica_token = enable_replica_reads()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            self._replica_token = None
+            reset_replica_reads(token)
+        user = getattr(request, 'user', None)
+        if (request.method not in SAFE_METHODS
+                and user is not None
+                and user.is_authenticated
+                and response.status_code < 400):
+            cache.set(self._pin_key(user), True, settings.REPLICA_PIN_SECONDS)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class PrecompressedListMixin:
+    """Кэширует отрендеренный список справочника во всех кодировках.
+
+    Сжатие выполняется один раз после изменения справочника
+    (см. api.signals), а не на каждый запрос. Кэшируется только
+    список без параметров запроса, поэтому число ключей не растёт
+    с каждым значением фильтра. В ключ входят число строк и
+    наибольший pk: вставки и удаления в обход сигналов (bulk_create,
+    загрузка из CSV) тоже дают новый ключ.
+    """
+
+    cache_prefix = None
+
+    def list(self, request, *args, **kwargs):
+        if (request.accepted_renderer.format != 'json'
+                or request.query_params):
+            return super().list(request, *args, **kwargs)
+        state = self.get_queryset().aggregate(
+            count=Count('pk'),
+            last=Max('pk')
+        )
+        key = reference_cache_key(
+            self.cache_prefix,
+            state['count'],
+            state['last']
+        )
+        payload = cache.get(key)
+        if payload is None:
+            response = super().list(request, *args, **kwargs)
+            payload = precompress(
+                request.accepted_renderer.render(
+                    response.data,
+                    request.accepted_media_type,
+                    self.get_renderer_context()
+                )
+            )
+            cache.set(key, payload, settings.REFERENCE_CACHE_TIMEOUT)
+        encoding = select_encoding(request)
+        if encoding not in payload:
+            encoding = IDENTITY
+        return apply_encoding(
+            HttpResponse(content_type=request.accepted_renderer.media_type),
+            payload[encoding],
+            encoding
+        )
+
+
+class FieldSelectionMixin:
+    """Разбор ?fields= и ?expand= для сериалайзеров вьюсета.
+
+    Запрошенные поля передаются сериалайзеру через контекст
+    (см. api.serializers.SparseFieldsMixin), а вьюсет по wants()
+    и expands() решает, какие join, prefetch и аннотации нужны.
+    """
+
+    def _query_names(self, param):
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        return frozenset(name for name in value.split(',') if name)
+
+    @cached_property
+    def requested_fields(self):
+        """Поля из ?fields=, None - все поля."""
+        return self._query_names('fields') or None
+
+    @cached_property
+    def expanded_fields(self):
+        """Раскрываемые поля из ?expand=, None - все целиком."""
+        return self._query_names('expand')
+
+    def wants(self, name):
+        return self.requested_fields is None or name in self.requested_fields
+
+    def expands(self, name):
+        return self.wants(name) and (
+            self.expanded_fields is None or name in self.expanded_fields
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.requested_fields
+        context['expand'] = self.expanded_fields
+        return context
+
+
+class ConditionalGetMixin:
+    """ETag и ответ 304 на If-None-Match для list и retrieve.
+
+    Вьюсет описывает версию ответа дешёвым запросом, переопределяя
+    get_etag_parts(); если клиент прислал ту же версию,
+    выборка страницы и сериализация не выполняются. Без
+    переопределения ETag не выставляется.
+    """
+
+    def get_etag_parts(self):
+        """Версия данных ответа; None - ETag не выставляется."""
+        return None
+
+    def get_etag(self):
+        parts = self.get_etag_parts()
+        if parts is None:
+            return None
+        digest = hashlib.sha1(repr((
+            self.request.accepted_renderer.format,
+            self.request.get_full_path(),
+            self.request.user.pk,
+            *parts,
+        )).encode()).hexdigest()
+        return f'"{digest}"'
+
+    @staticmethod
+    def _is_not_modified(request, etag):
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not header:
+            return False
+        etags = parse_etags(header)
+        return '*' in etags or etag in (
+            tag[2:] if tag.startswith('W/') else tag for tag in etags
+        )
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        etag = self.get_etag()
+        if etag is not None and self._is_not_modified(request, etag):
+            return Response(
+                status=HTTP_304_NOT_MODIFIED,
+                headers={'ETag': etag}
+            )
+        response = handler(request, *args, **kwargs)
+        if etag is not None and response.status_code == HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
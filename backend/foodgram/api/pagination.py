@@ -1,6 +1,121 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from foodgram.constants import (CHANGES_MAX_PAGE_SIZE,
+                                CHANGES_PAGE_SIZE,
+                                CHANGES_SETTLE_SECONDS)
 
 
 class LimitPaginator(PageNumberPagination):
 
     page_size_query_param = 'limit'
+
+
+class FeedPaginator(CursorPagination):
+    """Keyset-пагинация ленты подписок по дате публикации."""
+
+    ordering = ('-created', '-id')
+    page_size_query_param = 'limit'
+
+
+class InboxPaginator(CursorPagination):
+    """Keyset-пагинация входящих по id, от новых к старым."""
+
+    ordering = '-id'
+    page_size_query_param = 'limit'
+
+
+class ChangesPaginator:
+    """Keyset-пагинация изменений рецептов и удалений.
+
+    Токен хранит две позиции: (updated, id) последнего отданного
+    рецепта и (deleted, id) последней записи об удалении. Записи
+    моложе CHANGES_SETTLE_SECONDS не отдаются, пока не завершатся
+    транзакции, которые могли начаться раньше них.
+    """
+
+    query_param = 'since'
+    page_size_query_param = 'limit'
+
+    @staticmethod
+    def encode(recipes, tombstones):
+        data = json.dumps([
+            recipes[0].isoformat(),
+            recipes[1],
+            tombstones[0].isoformat(),
+            tombstones[1],
+        ])
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    @staticmethod
+    def decode(token):
+        try:
+            updated, recipe_id, deleted, tombstone_id = json.loads(
+                base64.urlsafe_b64decode(token.encode())
+            )
+            return (
+                (datetime.fromisoformat(updated), int(recipe_id)),
+                (datetime.fromisoformat(deleted), int(tombstone_id)),
+            )
+        except (TypeError, ValueError, binascii.Error):
+            raise ValidationError({'since': 'Некорректный токен'})
+
+    @staticmethod
+    def after(queryset, field, position):
+        moment, pk = position
+        return queryset.filter(
+            Q(**{f'{field}__gt': moment})
+            | Q(**{field: moment, 'pk__gt': pk})
+        ).order_by(field, 'pk')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return CHANGES_PAGE_SIZE
+        return min(max(size, 1), CHANGES_MAX_PAGE_SIZE)
+
+    def paginate(self, request, recipes, tombstones):
+        """Следующая страница: рецепты, id удалённых и новый токен.
+
+        Без токена рецепты отдаются с самого начала, а удаления -
+        только начиная с текущего момента: клиенту, у которого ещё
+        нет данных, прошлые удаления не нужны.
+        """
+        settled = timezone.now() - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+        token = request.query_params.get(self.query_param)
+        if token:
+            recipe_position, tombstone_position = self.decode(token)
+        else:
+            recipe_position = (datetime.min.replace(tzinfo=dt_timezone.utc), 0)
+            tombstone_position = (settled, 0)
+        size = self.get_page_size(request)
+        changed = list(
+            self.after(recipes, 'updated', recipe_position).filter(
+                updated__lt=settled
+            )[:size + 1]
+        )
+        deleted = list(
+            self.after(tombstones, 'deleted', tombstone_position).filter(
+                deleted__lt=settled
+            ).values_list('deleted', 'pk', 'recipe_id')[:size + 1]
+        )
+        has_more = len(changed) > size or len(deleted) > size
+        changed, deleted = changed[:size], deleted[:size]
+        if changed:
+            recipe_position = (changed[-1].updated, changed[-1].pk)
+        if deleted:
+            tombstone_position = deleted[-1][:2]
+        return (
+            changed,
+            [recipe_id for _, _, recipe_id in deleted],
+            self.encode(recipe_position, tombstone_position),
+            has_more,
+        )
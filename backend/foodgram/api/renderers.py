@@ -0,0 +1,82 @@
+import math
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+SCALAR_TYPES = frozenset((str, int, bool, type(None)))
+
+
+def _has_non_finite(data):
+    """Есть ли в данных NaN или Infinity.
+
+    Обход без рекурсии, строки и целые отсеиваются сравнением типа:
+    проверка идёт на каждом ответе с null и не должна съедать
+    выигрыш от orjson.
+    """
+    stack = [(data,)]
+    while stack:
+        for value in stack.pop():
+            if type(value) in SCALAR_TYPES:
+                continue
+            if isinstance(value, float):
+                if not math.isfinite(value):
+                    return True
+            elif isinstance(value, dict):
+                stack.append(value.values())
+            elif isinstance(value, (list, tuple)):
+                stack.append(value)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSON-рендерер на orjson с откатом на стандартный json.
+
+    Даты, Decimal, ленивые строки и прочие нестандартные типы
+    передаются в тот же энкодер DRF, поэтому вывод совпадает
+    со стандартным JSONRenderer. Отступы, ASCII-режим и значения,
+    которые orjson не сериализует, обрабатывает родительский рендерер.
+
+    orjson пишет NaN и Infinity как null; при STRICT_JSON такие
+    данные тоже уходят в родительский рендерер, который, как и
+    раньше, выбрасывает ValueError.
+    """
+
+    options = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None
+                or self.ensure_ascii
+                or not self.compact
+                or self.get_indent(
+                    accepted_media_type,
+                    renderer_context or {}
+                ) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=self.options
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if (api_settings.STRICT_JSON
+                and b'null' in ret
+                and _has_non_finite(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace(
+            '\u2029'.encode(), b'\\u2029'
+        )
@@ -1,18 +1,71 @@
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils.functional import cached_property
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
 
-from foodgram.constants import MAX_VALUE_AMOUNT, MAX_VALUE_TIME, MIN_VALUE
+from foodgram.constants import (MAX_BATCH_RECIPES,
+                                MAX_ID,
+                                MAX_MATCH_INGREDIENTS,
+                                MAX_VALUE_AMOUNT,
+                                MAX_VALUE_TIME,
+                                MIN_VALUE)
 from recipes.models import (Ingredient,
                             IngredientForRecipe,
                             Favorite,
                             Recipe,
+                            RecipeOutbox,
                             ShoppingCart,
                             Tag)
-from users.models import User, Subscribe
+from users.models import InboxItem, User, Subscribe
 
 
-class UserSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Набор полей по context['fields'] и раскрытие по context['expand'].
+
+    Без параметров отдаются все поля и вложенные объекты целиком.
+    Если передан expand, поля из expandable_fields, которых в нём нет,
+    сворачиваются до id. Действует только на объекты верхнего уровня
+    ответа, вложенные сериалайзеры и разбор входных данных не меняются.
+    """
+
+    expandable_fields = ()
+
+    @property
+    def _is_top_level(self):
+        parent = self.parent
+        return parent is None or (
+            isinstance(parent, serializers.ListSerializer)
+            and parent.parent is None
+        )
+
+    def is_requested(self, name):
+        fields = self.context.get('fields')
+        return fields is None or not self._is_top_level or name in fields
+
+    def is_expanded(self, name):
+        expand = self.context.get('expand')
+        return (
+            expand is None
+            or name not in self.expandable_fields
+            or not self._is_top_level
+            or name in expand
+        )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Входные данные проверяются по всем полям: выбор полей
+        # меняет только ответ, а не набор принимаемых данных.
+        if hasattr(self.root, 'initial_data'):
+            return fields
+        return {
+            name: field
+            for name, field in fields.items()
+            if self.is_requested(name)
+        }
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериалайзер для отображения информации о пользователе."""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -29,6 +82,9 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return bool(is_subscribed)
         request = self.context.get('request')
         return (
             request.user.is_authenticated
@@ -54,9 +110,55 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
 
 
+def resolve_pks(queryset, pks):
+    """Объекты по списку id одним запросом, в порядке списка.
+
+    Все несуществующие id попадают в одну ошибку валидации.
+    """
+    objects = queryset.in_bulk(set(pks))
+    missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+    if missing:
+        raise serializers.ValidationError(
+            'Объекты не существуют: '
+            + ', '.join(str(pk) for pk in missing)
+        )
+    return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.ListField):
+    """Список id связанных объектов, проверяемый одним запросом."""
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(
+            child=serializers.IntegerField(max_value=MAX_ID),
+            **kwargs
+        )
+
+    def to_internal_value(self, data):
+        return resolve_pks(self.queryset, super().to_internal_value(data))
+
+    def to_representation(self, data):
+        return [item.pk for item in data.all()]
+
+
+class IngredientForRecipeListSerializer(serializers.ListSerializer):
+    """Список ингредиентов рецепта с проверкой id одним запросом."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = resolve_pks(
+            Ingredient.objects.all(),
+            [item['id'] for item in items]
+        )
+        for item, ingredient in zip(items, ingredients):
+            item['id'] = ingredient
+        return items
+
+
 class IngredientForRecipeSerializer(serializers.ModelSerializer):
     """Сериалайзер для добавления ингредиентов к рецепту."""
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(max_value=MAX_ID)
     amount = serializers.IntegerField(
         min_value=MIN_VALUE,
         max_value=MAX_VALUE_AMOUNT,
@@ -71,6 +173,7 @@ class IngredientForRecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientForRecipe
         fields = ('id', 'amount')
+        list_serializer_class = IngredientForRecipeListSerializer
 
 
 class IngredientForRecipeGetSerializer(IngredientForRecipeSerializer):
@@ -110,8 +213,9 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериалайзер для чтения модели Recipes"""
+    expandable_fields = ('author', 'tags', 'ingredients')
     author = UserSerializer(
         read_only=True,
     )
@@ -148,15 +252,153 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    @cached_property
+    def _representers(self):
+        return [
+            (
+                name,
+                getattr(
+                    self,
+                    f'represent_{name}' if self.is_expanded(name)
+                    else f'collapse_{name}'
+                )
+            )
+            for name in self.Meta.fields
+            if self.is_requested(name)
+        ]
+
+    def to_representation(self, instance):
+        """Представление рецепта без вложенных сериалайзеров DRF.
+
+        Поля объявлены выше и дают ту же схему, но словарь собирается
+        напрямую из предзагруженных объектов: для страницы списка это
+        заметно дешевле, чем обход полей вложенных сериалайзеров.
+        Набор полей и раскрытие вложенных объектов задаются
+        context['fields'] и context['expand'].
+        """
+        return {
+            name: represent(instance)
+            for name, represent in self._representers
+        }
+
+    def represent_id(self, instance):
+        return instance.id
+
+    def represent_tags(self, instance):
+        return [
+            {
+                'id': tag.id,
+                'name': tag.name,
+                'color': tag.color,
+                'slug': tag.slug,
+            }
+            for tag in instance.tags.all()
+        ]
+
+    def collapse_tags(self, instance):
+        return [tag.id for tag in instance.tags.all()]
+
+    def represent_author(self, instance):
+        author = instance.author
+        is_subscribed = getattr(instance, 'author_is_subscribed', None)
+        if is_subscribed is None:
+            is_subscribed = UserSerializer(
+                context=self.context
+            ).get_is_subscribed(author)
+        return {
+            'email': author.email,
+            'id': author.id,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'is_subscribed': bool(is_subscribed),
+        }
+
+    def collapse_author(self, instance):
+        return instance.author_id
+
+    def represent_ingredients(self, instance):
+        return [
+            {
+                'id': ingredient.ingredients.id,
+                'name': ingredient.ingredients.name,
+                'measurement_unit': ingredient.ingredients.measurement_unit,
+                'amount': ingredient.amount,
+            }
+            for ingredient in instance.ingredient_list.all()
+        ]
+
+    def collapse_ingredients(self, instance):
+        return [
+            {
+                'id': ingredient.ingredients_id,
+                'amount': ingredient.amount,
+            }
+            for ingredient in instance.ingredient_list.all()
+        ]
+
+    def represent_is_favorited(self, instance):
+        return bool(getattr(instance, 'is_favorited', False))
+
+    def represent_is_in_shopping_cart(self, instance):
+        return bool(getattr(instance, 'is_in_shopping_cart', False))
+
+    def represent_name(self, instance):
+        return instance.name
+
+    def represent_image(self, instance):
+        if not instance.image:
+            return None
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(instance.image.url)
+        return instance.image.url
+
+    def represent_text(self, instance):
+        return instance.text
+
+    def represent_cooking_time(self, instance):
+        return instance.cooking_time
+
+
+class RecipeMatchSerializer(RecipeReadSerializer):
+    """Сериалайзер рецепта с долей имеющихся у пользователя ингредиентов."""
+
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('coverage',)
+
+    def represent_coverage(self, instance):
+        return instance.coverage
+
+
+class IngredientMatchSerializer(serializers.Serializer):
+    """Сериалайзер валидации списка имеющихся ингредиентов."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=MIN_VALUE, max_value=MAX_ID),
+        allow_empty=False,
+        max_length=MAX_MATCH_INGREDIENTS,
+    )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериалайзер списка id рецептов для пакетных операций."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=MIN_VALUE),
+        required=False,
+        allow_empty=False,
+        max_length=MAX_BATCH_RECIPES,
+    )
+
 
 class RecipeSerializer(RecipeReadSerializer):
     """Сериалайзер модели Recipe."""
 
     author = UserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-    )
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all())
     ingredients = IngredientForRecipeSerializer(
         many=True,)
     image = Base64ImageField()
@@ -207,23 +449,24 @@ class RecipeSerializer(RecipeReadSerializer):
             )
         IngredientForRecipe.objects.bulk_create(ingredient_list)
 
+    @transaction.atomic
     def create(self, validated_data):
+        """Рецепт и запись для рассылки подписчикам - одной транзакцией."""
         author = self.context['request'].user
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags)
         self.create_ingredient(ingredients, recipe)
+        RecipeOutbox.objects.create(recipe=recipe)
         return recipe
 
     def update(self, instance, validated_data):
-        instance.tags.clear()
         tags = validated_data.pop('tags')
         instance.tags.set(tags)
         ingredients = validated_data.pop('ingredients')
         instance.ingredients.clear()
         self.create_ingredient(ingredients, instance)
-        instance.save()
         return super().update(instance, validated_data)
 
     def validate(self, data):
@@ -263,6 +506,16 @@ class RecipeSerializer(RecipeReadSerializer):
         return value
 
     def to_representation(self, instance):
+        prefetch_related_objects(
+            (instance,),
+            'tags',
+            Prefetch(
+                'ingredient_list',
+                queryset=IngredientForRecipe.objects.select_related(
+                    'ingredients'
+                )
+            )
+        )
         return RecipeReadSerializer(
             instance=instance,
             context=self.context
@@ -272,6 +525,7 @@ class RecipeSerializer(RecipeReadSerializer):
 class SubscribeListSerializer(UserSerializer):
     """Сериалайзер модели Subscribe."""
 
+    expandable_fields = ('recipes',)
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
 
@@ -289,32 +543,53 @@ class SubscribeListSerializer(UserSerializer):
         )
 
     def get_recipes_count(self, obj):
+        recipes_count = getattr(obj, 'recipes_count', None)
+        if recipes_count is not None:
+            return recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            try:
-                recipes = recipes[:int(recipes_limit)]
-            except ValueError:
-                pass
+        recipes = getattr(obj, 'recipe_previews', None)
+        if recipes is None:
+            request = self.context.get('request')
+            recipes_limit = request.GET.get('recipes_limit')
+            recipes = obj.recipes.all()
+            if recipes_limit:
+                try:
+                    recipes = recipes[:int(recipes_limit)]
+                except ValueError:
+                    pass
+        if not self.is_expanded('recipes'):
+            return [recipe.pk for recipe in recipes]
         return ShortRecipeSerializer(recipes, many=True).data
 
 
-class SubscribePostSerializer(serializers.ModelSerializer):
+class IdempotentCreateMixin:
+    """Создание связи без предварительной проверки уникальности.
+
+    Вместо SELECT валидатора уникальности выполняется
+    INSERT ... ON CONFLICT DO NOTHING, поэтому повторный или
+    параллельный запрос не приводит к IntegrityError.
+    """
+
+    def create(self, validated_data):
+        instance = self.Meta.model(**validated_data)
+        self.Meta.model.objects.bulk_create(
+            (instance,),
+            ignore_conflicts=True
+        )
+        return instance
+
+
+class SubscribePostSerializer(IdempotentCreateMixin,
+                              serializers.ModelSerializer):
     """Сериалайзер модели Subscribe"""
+
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
     class Meta:
         model = Subscribe
         fields = ('author', 'user')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Subscribe.objects.all(),
-                fields=('author', 'user'),
-                message='Вы уже подписаны на автора.'
-            )
-        ]
 
     def validate(self, data):
         request = self.context.get('request')
@@ -332,22 +607,17 @@ class SubscribePostSerializer(serializers.ModelSerializer):
         ).data
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(IdempotentCreateMixin, serializers.ModelSerializer):
     """Сериалайзер валидации Избранного"""
 
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
     class Meta:
         model = Favorite
         fields = (
             'user',
             'recipe'
         )
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже есть в избранном!'
-            )
-        ]
 
     def to_representation(self, instance):
         return ShortRecipeSerializer(
@@ -356,21 +626,28 @@ class FavoriteSerializer(serializers.ModelSerializer):
         ).data
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class ShoppingCartSerializer(IdempotentCreateMixin,
+                             serializers.ModelSerializer):
     """Сериализатор валидации корзины покупок"""
+
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
     class Meta:
         model = ShoppingCart
         fields = ('user', 'recipe',)
-        validators = [
-            UniqueTogetherValidator(
-                queryset=ShoppingCart.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже есть в списке покупок'
-            )
-        ]
 
     def to_representation(self, instance):
         return ShortRecipeSerializer(
             instance.recipe,
             context=self.context
         ).data
+
+
+class InboxItemSerializer(serializers.ModelSerializer):
+    """Сериалайзер нового рецепта автора из подписок."""
+
+    recipe = ShortRecipeSerializer(read_only=True)
+
+    class Meta:
+        model = InboxItem
+        fields = ('id', 'recipe', 'created')
@@ -0,0 +1,1063 @@
+import base64
+import io
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+from http import HTTPStatus
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from api.checks import check_shared_cache
+from api.filters import UsersFilterSet
+from api.renderers import ORJSONRenderer
+from api.serializers import RecipeReadSerializer
+from api.throttling import FavoriteThrottle
+from foodgram import db_router
+from recipes.models import (Favorite,
+                            Ingredient,
+                            IngredientForRecipe,
+                            Recipe,
+                            RecipeOutbox,
+                            RecipeScore,
+                            ShoppingCart,
+                            Tag)
+from users.models import InboxItem, Subscribe, User
+
+
+def create_user(number):
+    return User.objects.create(
+        username=f'user{number}',
+        email=f'user{number}@example.com',
+        first_name='Имя',
+        last_name='Фамилия'
+    )
+
+
+def create_recipe(author, number=0):
+    return Recipe.objects.create(
+        author=author,
+        name=f'Рецепт {number}',
+        image='recipe.png',
+        text='Описание',
+        cooking_time=10
+    )
+
+
+def fill_recipe(recipe, tags, ingredients):
+    recipe.tags.set(tags)
+    IngredientForRecipe.objects.bulk_create(
+        IngredientForRecipe(
+            recipe=recipe,
+            ingredients=ingredient,
+            amount=number + 1
+        )
+        for number, ingredient in enumerate(ingredients)
+    )
+
+
+class SharedCacheCheckTests(APITestCase):
+
+    def check(self, backend, debug=False):
+        caches = {'default': {'BACKEND': backend}}
+        with override_settings(CACHES=caches, DEBUG=debug):
+            return [error.id for error in check_shared_cache(None)]
+
+    def test_local_cache_is_rejected_outside_debug(self):
+        locmem = 'django.core.cache.backends.locmem.LocMemCache'
+        self.assertEqual(self.check(locmem), ['api.E001'])
+        self.assertEqual(self.check(locmem, debug=True), [])
+        self.assertEqual(
+            self.check('django.core.cache.backends.redis.RedisCache'),
+            []
+        )
+
+
+class IngredientMatchTests(APITestCase):
+    """Подбор рецептов по имеющимся ингредиентам."""
+
+    def test_too_large_ingredient_id_is_rejected(self):
+        response = self.client.get(
+            '/api/recipes/match/',
+            {'ingredients': '99999999999999999999'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def match(self, *ingredients):
+        response = self.client.get(
+            '/api/recipes/match/',
+            {'ingredients': [ingredient.pk for ingredient in ingredients]}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            (recipe['id'], recipe['coverage'])
+            for recipe in response.json()['results']
+        ]
+
+    def test_index_follows_recipe_changes(self):
+        cache.clear()
+        author = create_user(1)
+        salt, pepper = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'перец')
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = create_recipe(author)
+            fill_recipe(recipe, [], [salt, pepper])
+        self.assertEqual(self.match(salt), [(recipe.pk, 0.5)])
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientForRecipe.objects.get(ingredients=pepper).delete()
+        self.assertEqual(self.match(salt), [(recipe.pk, 1.0)])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertEqual(self.match(salt), [])
+
+
+class RecipeTagsFilterTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user(1)
+        cls.lunch = Tag.objects.create(name='Обед', color='#49B64E', slug='b')
+        cls.recipe = create_recipe(author)
+        fill_recipe(cls.recipe, [cls.lunch], [])
+        create_recipe(author, 1)
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, *tags):
+        response = self.client.get('/api/recipes/', {'tags': tags})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_unknown_slug_is_not_an_error(self):
+        self.assertEqual(self.ids('b', 'unknown'), [self.recipe.pk])
+        self.assertEqual(self.ids('unknown'), [])
+
+
+class ORJSONRendererTests(APITestCase):
+
+    def test_matches_json_renderer(self):
+        data = {'name': 'Соль\u2028', 'amount': 1.5, 'tags': [1, None]}
+        self.assertEqual(
+            ORJSONRenderer().render(data),
+            JSONRenderer().render(data)
+        )
+
+    def test_non_finite_float_raises(self):
+        for value in (float('nan'), float('inf'), float('-inf')):
+            with self.subTest(value):
+                for data in ({'results': [{'score': value}]},
+                             [None, (1, value)],
+                             value):
+                    with self.assertRaises(ValueError):
+                        ORJSONRenderer().render(data)
+
+
+class ReferenceCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+
+    def test_bulk_insert_bypassing_signals_is_visible(self):
+        self.assertEqual(len(self.client.get('/api/tags/').json()), 1)
+        Tag.objects.bulk_create([
+            Tag(name='Обед', color='#49B64E', slug='lunch')
+        ])
+        self.assertEqual(len(self.client.get('/api/tags/').json()), 2)
+
+    def test_filtered_list_is_not_cached(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        with mock.patch.object(cache, 'set') as cache_set:
+            response = self.client.get('/api/ingredients/', {'name': 'со'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.json()), 1)
+        cache_set.assert_not_called()
+
+
+class SimilarRecipesTests(APITestCase):
+    """Похожие рецепты."""
+
+    def test_non_numeric_pk_is_not_found(self):
+        response = self.client.get('/api/recipes/abc/similar/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class ReplicaRoutingTests(APITestCase):
+    """Все чтения одного запроса идут на одну реплику."""
+
+    replicas = ['replica_0', 'replica_1']
+
+    def test_alias_is_chosen_once_per_request(self):
+        router = db_router.ReplicaRouter()
+        with mock.patch.object(
+            db_router, '_weighted_replicas', self.replicas
+        ), mock.patch.object(
+            db_router, '_replicas', itertools.cycle(self.replicas)
+        ), mock.patch.object(
+            db_router, '_is_available', return_value=True
+        ):
+            chosen = []
+            for _ in self.replicas:
+                with db_router.replica_reads():
+                    aliases = {
+                        router.db_for_read(Recipe) for _ in range(5)
+                    }
+                self.assertEqual(len(aliases), 1)
+                chosen.extend(aliases)
+            self.assertEqual(chosen, self.replicas)
+        self.assertIsNone(router.db_for_read(Recipe))
+
+
+class FavoriteWriteTests(APITestCase):
+    """Лимит частоты и идемпотентность добавления в избранное."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user(1)
+        self.recipe = create_recipe(self.user)
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/recipes/{self.recipe.pk}/favorite/'
+
+    def test_requests_over_limit_are_throttled(self):
+        limit = 3
+        with mock.patch.object(
+            FavoriteThrottle,
+            'THROTTLE_RATES',
+            {'favorite': f'{limit}/min'}
+        ):
+            statuses = [
+                self.client.post(self.url).status_code
+                for _ in range(limit + 2)
+            ]
+        self.assertEqual(statuses[:limit], [HTTPStatus.CREATED] * limit)
+        self.assertEqual(
+            statuses[limit:],
+            [HTTPStatus.TOO_MANY_REQUESTS] * 2
+        )
+
+    def test_double_post_creates_one_row(self):
+        first = self.client.post(self.url)
+        second = self.client.post(self.url)
+        self.assertEqual(first.status_code, HTTPStatus.CREATED)
+        self.assertEqual(second.status_code, HTTPStatus.CREATED)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(
+            Favorite.objects.filter(user=self.user).count(),
+            1
+        )
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'Параллельные транзакции проверяются на PostgreSQL'
+)
+class ConcurrentFavoriteTests(TransactionTestCase):
+    """Одновременные запросы на добавление одного рецепта."""
+
+    workers = 4
+
+    def test_parallel_posts_create_one_row(self):
+        cache.clear()
+        user = create_user(1)
+        recipe = create_recipe(user)
+        barrier = threading.Barrier(self.workers)
+        statuses = []
+
+        def post():
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                statuses.append(client.post(
+                    f'/api/recipes/{recipe.pk}/favorite/'
+                ).status_code)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=post) for _ in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [HTTPStatus.CREATED] * self.workers)
+        self.assertEqual(Favorite.objects.filter(user=user).count(), 1)
+
+
+class RecipeReadSerializerParityTests(APITestCase):
+    """Ручная сборка рецепта совпадает с выводом полей ModelSerializer.
+
+    Эталон - Serializer.to_representation по объявленным полям того же
+    сериалайзера, поэтому расхождение в represent_* сразу видно.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(1)
+        cls.reader = create_user(2)
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тэг {number}',
+                color=f'#00000{number}',
+                slug=f'tag{number}'
+            )
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}',
+                measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        cls.recipe = create_recipe(cls.author)
+        fill_recipe(cls.recipe, cls.tags, cls.ingredients)
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipe)
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.recipe)
+        Subscribe.objects.create(user=cls.reader, author=cls.author)
+
+    def make_request(self, user=None):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        if user is not None:
+            request.user = user
+        return request
+
+    def load_recipe(self, user=None, annotate=True):
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            'ingredient_list__ingredients'
+        )
+        if user is not None and annotate:
+            recipes = recipes.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user,
+                    recipe=OuterRef('pk')
+                )),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user,
+                    recipe=OuterRef('pk')
+                )),
+                author_is_subscribed=Exists(Subscribe.objects.filter(
+                    user=user,
+                    author=OuterRef('author')
+                ))
+            )
+        return recipes.get(pk=self.recipe.pk)
+
+    def assert_parity(self, instance, **context):
+        serializer = RecipeReadSerializer(context=context)
+        self.assertEqual(
+            serializer.to_representation(instance),
+            serializers.Serializer.to_representation(serializer, instance)
+        )
+
+    def test_anonymous(self):
+        self.assert_parity(
+            self.load_recipe(),
+            request=self.make_request(AnonymousUser())
+        )
+
+    def test_annotated_user_flags(self):
+        self.assert_parity(
+            self.load_recipe(self.reader),
+            request=self.make_request(self.reader)
+        )
+
+    def test_user_flags_without_annotations(self):
+        self.assert_parity(
+            self.load_recipe(self.reader, annotate=False),
+            request=self.make_request(self.reader)
+        )
+
+    def test_requested_fields(self):
+        self.assert_parity(
+            self.load_recipe(self.reader),
+            request=self.make_request(self.reader),
+            fields={'id', 'author', 'image', 'cooking_time'}
+        )
+
+
+def image_base64():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def use_temp_media(test):
+    """Загруженные в тесте картинки пишутся во временный каталог."""
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root)
+    settings_override = override_settings(MEDIA_ROOT=media_root)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
+class RecipeQueryCountTests(APITestCase):
+    """Число запросов не растёт с размером страницы и рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(1)
+        cls.reader = create_user(2)
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', color='#E26C2D', slug='a'),
+            Tag.objects.create(name='Обед', color='#49B64E', slug='b'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(3)
+        ]
+        for number in range(6):
+            fill_recipe(
+                create_recipe(cls.author, number),
+                cls.tags,
+                cls.ingredients
+            )
+
+    def setUp(self):
+        cache.clear()
+        use_temp_media(self)
+        self.client.force_authenticate(self.reader)
+
+    def count_queries(self, request, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = request(*args, **kwargs)
+        self.assertLess(response.status_code, 300, response.content)
+        return len(context)
+
+    def test_list(self):
+        queries = self.count_queries(
+            self.client.get, '/api/recipes/', {'limit': 1}
+        )
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/recipes/', {'limit': 6})
+        self.assertEqual(len(response.json()['results']), 6)
+
+    def recipe_data(self, ingredients):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': image_base64(),
+            'tags': [tag.pk for tag in self.tags[:len(ingredients) - 1]],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_create(self):
+        queries = self.count_queries(
+            self.client.post,
+            '/api/recipes/',
+            self.recipe_data(self.ingredients[:2]),
+            format='json'
+        )
+        with self.assertNumQueries(queries):
+            response = self.client.post(
+                '/api/recipes/',
+                self.recipe_data(self.ingredients),
+                format='json'
+            )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(len(response.json()['ingredients']), 3)
+
+    def test_create_rejects_ids_beyond_int64(self):
+        data = self.recipe_data(self.ingredients)
+        data['tags'] = [2 ** 63]
+        data['ingredients'][0]['id'] = 2 ** 63
+        response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('tags', response.json())
+        self.assertIn('ingredients', response.json())
+
+
+class RecipeFieldSelectionWriteTests(APITestCase):
+    """?fields= сужает ответ, но не принимаемые данные."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(1)
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E', slug='b')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль',
+            measurement_unit='г'
+        )
+        cls.recipe = create_recipe(cls.author)
+        fill_recipe(cls.recipe, [cls.tag], [cls.ingredient])
+
+    def setUp(self):
+        cache.clear()
+        use_temp_media(self)
+        self.client.force_authenticate(self.author)
+
+    def recipe_data(self, name):
+        return {
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': image_base64(),
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 10}],
+        }
+
+    def test_create(self):
+        response = self.client.post(
+            '/api/recipes/?fields=id,name',
+            self.recipe_data('Новый рецепт'),
+            format='json'
+        )
+        self.assertEqual(
+            response.status_code,
+            HTTPStatus.CREATED,
+            response.content
+        )
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        self.assertEqual(
+            response.json(),
+            {'id': recipe.pk, 'name': 'Новый рецепт'}
+        )
+        self.assertEqual(recipe.ingredients.get(), self.ingredient)
+
+    def test_update(self):
+        data = self.recipe_data('Другое название')
+        data['cooking_time'] = 42
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/?fields=id',
+            data,
+            format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK, response.content)
+        self.assertEqual(response.json(), {'id': self.recipe.pk})
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Другое название')
+        self.assertEqual(self.recipe.cooking_time, 42)
+
+
+class RecipeETagTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(1)
+        cls.recipe = create_recipe(cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            etag = self.client.get(url)['ETag']
+            for header in (etag, f'W/{etag}'):
+                with self.subTest(url=url, header=header):
+                    response = self.client.get(
+                        url,
+                        HTTP_IF_NONE_MATCH=header
+                    )
+                    self.assertEqual(
+                        response.status_code,
+                        HTTPStatus.NOT_MODIFIED
+                    )
+
+    def test_author_change_invalidates_list(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.author.first_name = 'Другое имя'
+        self.author.save()
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            response.json()['results'][0]['author']['first_name'],
+            'Другое имя'
+        )
+
+
+class UserSearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [create_user(number) for number in range(3)]
+        cls.cook = User.objects.create(
+            username='Cook',
+            email='chef@example.com',
+            first_name='Gordon',
+            last_name='Ramsay'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.users[0])
+
+    def test_search_any_field_ignoring_case(self):
+        for value in ('OOK', 'chef@', 'gord', 'RAMS'):
+            with self.subTest(value):
+                response = self.client.get(
+                    '/api/users/directory/',
+                    {'search': value}
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(
+                    [user['id'] for user in response.json()],
+                    [self.cook.pk]
+                )
+
+    def test_short_search_is_rejected(self):
+        response = self.client.get('/api/users/directory/', {'search': 'co'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    @skipUnless(connection.vendor == 'postgresql', 'pg_trgm есть в PostgreSQL')
+    def test_search_uses_trigram_indexes(self):
+        indexes = [
+            f'users_user_{field}_trgm_idx'
+            for field in UsersFilterSet.search_fields
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname FROM pg_indexes WHERE tablename = %s',
+                ['users_user']
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+        self.assertLessEqual(set(indexes), existing)
+        queryset = UsersFilterSet(
+            data={'search': 'cook'},
+            queryset=User.objects.all()
+        ).qs
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        for index in indexes:
+            self.assertIn(index, plan)
+
+
+class FeedTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user(1)
+        cls.author = create_user(2)
+        cls.stranger = create_user(3)
+        Subscribe.objects.create(user=cls.reader, author=cls.author)
+        cls.feed = [
+            create_recipe(cls.author, number).pk for number in range(5)
+        ][::-1]
+        create_recipe(cls.stranger)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_feed_is_empty(self):
+        response = self.client.get('/api/recipes/', {'feed': 'following'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_cursor_pages(self):
+        self.client.force_authenticate(self.reader)
+        for params in ({}, {'ordering': 'trending'}):
+            with self.subTest(**params):
+                url, ids = '/api/recipes/', []
+                query = {'feed': 'following', 'limit': 2, **params}
+                while url:
+                    page = self.client.get(url, query).json()
+                    self.assertNotIn('count', page)
+                    ids += [recipe['id'] for recipe in page['results']]
+                    url, query = page['next'], None
+                self.assertEqual(ids, self.feed)
+
+
+class TrendingOrderingTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user(1)
+        cls.recipes = [create_recipe(author, number) for number in range(4)]
+        now = timezone.now()
+        RecipeScore.objects.bulk_create([
+            RecipeScore(recipe=cls.recipes[0], score=2.0, updated=now),
+            RecipeScore(recipe=cls.recipes[1], score=5.0, updated=now),
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_scored_first_then_unscored(self):
+        first, second, third, fourth = (recipe.pk for recipe in self.recipes)
+        self.assertEqual(
+            self.ids(ordering='trending'),
+            [second, first, fourth, third]
+        )
+
+    def test_unknown_ordering_is_ignored(self):
+        self.assertEqual(self.ids(ordering='name'), self.ids())
+
+    def test_read_does_not_write(self):
+        with CaptureQueriesContext(connection) as context:
+            self.ids(ordering='trending')
+        self.assertFalse([
+            query for query in context.captured_queries
+            if not query['sql'].lstrip().upper().startswith('SELECT')
+        ])
+
+
+class ShoppingCartClearTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        cls.other = create_user(2)
+        cls.recipes = [create_recipe(cls.user, number) for number in range(3)]
+        ShoppingCart.objects.bulk_create(
+            [ShoppingCart(user=cls.user, recipe=recipe)
+             for recipe in cls.recipes]
+            + [ShoppingCart(user=cls.other, recipe=cls.recipes[0])]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def clear(self, data=None):
+        response = self.client.delete(
+            '/api/recipes/shopping_cart/',
+            data,
+            format='json'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(response.content, b'')
+
+    def cart(self, user):
+        return set(ShoppingCart.objects.filter(user=user).values_list(
+            'recipe_id',
+            flat=True
+        ))
+
+    def test_clear_selected_then_all(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        self.clear({'recipes': [first, second]})
+        self.assertEqual(self.cart(self.user), {third})
+        self.clear()
+        self.assertEqual(self.cart(self.user), set())
+        self.assertEqual(self.cart(self.other), {first})
+
+    def test_clear_empty_cart(self):
+        self.clear()
+        self.clear()
+        self.clear({'recipes': [self.recipes[0].pk]})
+
+
+class RecipeChangesTests(APITestCase):
+    """Синхронизация через /api/recipes/changes/."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(1)
+        cls.recipes = [
+            create_recipe(cls.author, number) for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        settle = mock.patch('api.pagination.CHANGES_SETTLE_SECONDS', 0)
+        settle.start()
+        self.addCleanup(settle.stop)
+
+    def changes(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get('/api/recipes/changes/', params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.json()
+
+    def test_pages_then_edits_and_deletes(self):
+        first, second, third = self.recipes
+        page = self.changes(limit=2)
+        self.assertTrue(page['has_more'])
+        self.assertEqual(
+            [recipe['id'] for recipe in page['changed']],
+            [first.pk, second.pk]
+        )
+        page = self.changes(page['since'], limit=2)
+        self.assertFalse(page['has_more'])
+        self.assertEqual([recipe['id'] for recipe in page['changed']],
+                         [third.pk])
+        self.assertEqual(page['deleted'], [])
+        token = page['since']
+        self.assertEqual(self.changes(token)['changed'], [])
+
+        second.name = 'Новое название'
+        second.save()
+        deleted_pk = first.pk
+        first.delete()
+        page = self.changes(token)
+        self.assertEqual(
+            [(recipe['id'], recipe['name']) for recipe in page['changed']],
+            [(second.pk, 'Новое название')]
+        )
+        self.assertEqual(page['deleted'], [deleted_pk])
+        page = self.changes(page['since'])
+        self.assertEqual((page['changed'], page['deleted']), ([], []))
+
+    def test_fresh_changes_wait_for_settle(self):
+        with mock.patch('api.pagination.CHANGES_SETTLE_SECONDS', 60):
+            self.assertEqual(self.changes()['changed'], [])
+
+    def test_invalid_token(self):
+        response = self.client.get(
+            '/api/recipes/changes/',
+            {'since': 'not-a-token'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class RecipeFacetsTests(APITestCase):
+    """Счётчики фильтров в списке рецептов (?facets=1)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user(1)
+        breakfast = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='a'
+        )
+        lunch = Tag.objects.create(name='Обед', color='#49B64E', slug='b')
+        Tag.objects.create(name='Ужин', color='#8775D2', slug='c')
+        for number, (tags, cooking_time) in enumerate((
+            ((breakfast, lunch), 10),
+            ((breakfast,), 20),
+            ((), 45),
+        )):
+            recipe = create_recipe(author, number)
+            recipe.cooking_time = cooking_time
+            recipe.save()
+            recipe.tags.set(tags)
+
+    def setUp(self):
+        cache.clear()
+
+    def facets(self, **params):
+        response = self.client.get('/api/recipes/', {'facets': 1, **params})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.json()['facets']
+
+    def test_counts(self):
+        facets = self.facets()
+        self.assertEqual(facets['tags'], {'a': 2, 'b': 1, 'c': 0})
+        self.assertEqual(
+            [bucket['count'] for bucket in facets['cooking_time']],
+            [1, 1, 1, 0]
+        )
+
+    def test_counts_follow_filters(self):
+        facets = self.facets(tags='b')
+        self.assertEqual(facets['tags'], {'a': 1, 'b': 1, 'c': 0})
+        self.assertEqual(
+            [bucket['count'] for bucket in facets['cooking_time']],
+            [1, 0, 0, 0]
+        )
+
+    def test_without_facets(self):
+        response = self.client.get('/api/recipes/')
+        self.assertNotIn('facets', response.json())
+
+
+class FanoutInboxTests(APITestCase):
+    """Рассылка новых рецептов подписчикам и /api/users/me/inbox/."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(0)
+        cls.followers = [create_user(number) for number in range(1, 4)]
+        cls.stranger = create_user(4)
+        Subscribe.objects.bulk_create(
+            Subscribe(user=user, author=cls.author) for user in cls.followers
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def fanout(self, **options):
+        call_command('fanout', pause=0, stdout=io.StringIO(), **options)
+
+    def publish(self, number):
+        recipe = create_recipe(self.author, number)
+        RecipeOutbox.objects.create(recipe=recipe)
+        return recipe
+
+    def test_delivers_to_followers_only(self):
+        recipe = self.publish(0)
+        self.fanout()
+        self.assertEqual(
+            set(InboxItem.objects.values_list('user', 'recipe')),
+            {(user.pk, recipe.pk) for user in self.followers}
+        )
+        self.assertFalse(RecipeOutbox.objects.exists())
+
+    def test_interrupted_fanout_resumes(self):
+        recipe = self.publish(0)
+        self.fanout(batch_size=2, limit=2)
+        self.assertEqual(InboxItem.objects.count(), 2)
+        self.assertEqual(
+            RecipeOutbox.objects.get(recipe=recipe).cursor,
+            Subscribe.objects.order_by('pk')[1].pk
+        )
+        self.fanout(batch_size=2)
+        self.assertEqual(
+            InboxItem.objects.filter(recipe=recipe).count(),
+            len(self.followers)
+        )
+        self.assertFalse(RecipeOutbox.objects.exists())
+
+    def test_inbox_newest_first_with_cursor(self):
+        recipes = [self.publish(number) for number in range(3)]
+        self.fanout()
+        self.client.force_authenticate(self.followers[0])
+        response = self.client.get('/api/users/me/inbox/', {'limit': 2})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        page = response.json()
+        self.assertEqual(
+            [item['recipe']['id'] for item in page['results']],
+            [recipes[2].pk, recipes[1].pk]
+        )
+        page = self.client.get(page['next']).json()
+        self.assertEqual(
+            [item['recipe']['id'] for item in page['results']],
+            [recipes[0].pk]
+        )
+        self.assertIsNone(page['next'])
+
+    def test_inbox_is_private(self):
+        self.publish(0)
+        self.fanout()
+        self.client.force_authenticate(self.stranger)
+        response = self.client.get('/api/users/me/inbox/')
+        self.assertEqual(response.json()['results'], [])
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/users/me/inbox/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+
+class ShoppingCartDownloadTests(APITestCase):
+    """Выгрузка списка покупок с приведением единиц (?merge=1)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        sugar_grams = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+        sugar_spoons = Ingredient.objects.create(
+            name='сахар', measurement_unit='ст. л.'
+        )
+        flour = Ingredient.objects.create(name='мука', measurement_unit='кг')
+        first, second = (create_recipe(cls.user, number) for number in (0, 1))
+        IngredientForRecipe.objects.bulk_create((
+            IngredientForRecipe(
+                recipe=first, ingredients=sugar_grams, amount=100
+            ),
+            IngredientForRecipe(
+                recipe=second, ingredients=sugar_spoons, amount=2
+            ),
+            IngredientForRecipe(recipe=second, ingredients=flour, amount=1),
+        ))
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in (first, second)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def download(self, **params):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            params
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return b''.join(response.streaming_content).decode().splitlines()[1:]
+
+    def test_lines_per_unit(self):
+        self.assertEqual(
+            self.download(),
+            ['мука кг 1', 'сахар г 100', 'сахар ст. л. 2']
+        )
+
+    def test_merge_converts_units(self):
+        self.assertEqual(
+            self.download(merge=1),
+            ['мука г 1000', 'сахар г 150']
+        )
+
+
+class ShoppingCartDeliveryTests(APITestCase):
+    """Отдача списка покупок через X-Accel-Redirect."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1)
+        recipe = create_recipe(cls.user)
+        fill_recipe(
+            recipe,
+            (),
+            (Ingredient.objects.create(name='соль', measurement_unit='г'),)
+        )
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.spool_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_root)
+        self.client.force_authenticate(self.user)
+
+    def download(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response
+
+    def test_file_is_spooled_for_nginx(self):
+        with override_settings(USE_X_ACCEL_REDIRECT=True,
+                               SPOOL_ROOT=self.spool_root,
+                               SPOOL_URL='/spool/'):
+            response = self.download()
+            repeated = self.download()
+        self.assertEqual(response.content, b'')
+        self.assertIn('user1_shopping_cart.txt',
+                      response['Content-Disposition'])
+        location = response['X-Accel-Redirect']
+        self.assertTrue(location.startswith('/spool/'))
+        self.assertEqual(repeated['X-Accel-Redirect'], location)
+        path = os.path.join(self.spool_root, location[len('/spool/'):])
+        with open(path, encoding='utf-8') as file:
+            self.assertIn('соль г 1', file.read())
+
+    def test_without_nginx_django_sends_file(self):
+        with override_settings(USE_X_ACCEL_REDIRECT=None,
+                               SPOOL_ROOT=self.spool_root):
+            response = self.download()
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertIn(
+            'соль г 1',
+            b''.join(response.streaming_content).decode()
+        )
+        self.assertEqual(os.listdir(self.spool_root), [])
@@ -0,0 +1,19 @@
+from rest_framework.throttling import UserRateThrottle
+
+
+class FavoriteThrottle(UserRateThrottle):
+    """Ограничение частоты запросов к избранному."""
+
+    scope = 'favorite'
+
+
+class ShoppingCartThrottle(UserRateThrottle):
+    """Ограничение частоты запросов к списку покупок."""
+
+    scope = 'shopping_cart'
+
+
+class SubscribeThrottle(UserRateThrottle):
+    """Ограничение частоты запросов к подпискам."""
+
+    scope = 'subscribe'
@@ -1,64 +1,120 @@
 from http import HTTPStatus
+from itertools import chain
 
 
-from django.db.models import Exists, OuterRef, Subquery, Sum
-from django.http import FileResponse
+from django.db.models import (Count,
+                              Exists,
+                              Max,
+                              OuterRef,
+                              Prefetch,
+                              Q,
+                              Sum,
+                              Value)
+from django.db.models.functions import Lower
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework.response import Response
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import (AllowAny,
                                         IsAuthenticated,
                                         IsAuthenticatedOrReadOnly,)
 
-from api.filters import IngredientsFilterSet, RecipeFilterSet
-from api.pagination import LimitPaginator
+from api.delivery import deliver_file
+from api.filters import (IngredientsFilterSet,
+                         RecipeFilterSet,
+                         UsersFilterSet)
+from api.mixins import (ConditionalGetMixin,
+                        FieldSelectionMixin,
+                        PrecompressedListMixin,
+                        ReplicaReadMixin)
+from api.pagination import (ChangesPaginator,
+                            FeedPaginator,
+                            InboxPaginator,
+                            LimitPaginator)
 from api.permissions import IsAuthorOrAuthenticadedReadOnly
 from api.serializers import (UserSerializer,
                              FavoriteSerializer,
+                             InboxItemSerializer,
+                             IngredientMatchSerializer,
                              IngredientSerializer,
+                             RecipeIdsSerializer,
+                             RecipeMatchSerializer,
                              RecipeReadSerializer,
                              RecipeSerializer,
                              ShoppingCartSerializer,
+                             ShortRecipeSerializer,
                              SubscribeListSerializer,
                              SubscribePostSerializer,
                              TagSerializer)
+from api.throttling import (FavoriteThrottle,
+                            ShoppingCartThrottle,
+                            SubscribeThrottle)
+from foodgram.constants import (COOKING_TIME_BUCKETS,
+                                FEED_FOLLOWING,
+                                TRENDING,
+                                USER_DIRECTORY_LIMIT)
 from recipes.models import (Favorite,
                             Ingredient,
                             IngredientForRecipe,
                             Recipe,
+                            RecipeScore,
+                            RecipeTombstone,
                             ShoppingCart,
                             Tag)
-from users.models import User, Subscribe
+from recipes.trending import record_event
+from users.models import InboxItem, User, Subscribe
 
 
-class UserViewSet(UserViewSet):
+class UserViewSet(ReplicaReadMixin, FieldSelectionMixin, UserViewSet):
     """Вьюсет для работы с пользователями."""
 
     queryset = User.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = LimitPaginator
     serializer_class = UserSerializer
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = UsersFilterSet
+    read_actions = ('list', 'retrieve', 'subscriptions')
+    user_columns = ('email', 'id', 'username', 'first_name', 'last_name')
 
     def get_permissions(self):
         if self.action == 'me':
             return (IsAuthenticated(),)
         return super().get_permissions()
 
+    def get_queryset(self):
+        """Колонки и аннотации только для запрошенных полей."""
+        queryset = super().get_queryset()
+        if self.action not in self.read_actions:
+            return queryset
+        queryset = queryset.only(
+            'id',
+            *(name for name in self.user_columns if self.wants(name))
+        )
+        user = self.request.user
+        if user.is_authenticated and self.wants('is_subscribed'):
+            queryset = queryset.annotate(
+                is_subscribed=Exists(
+                    Subscribe.objects.filter(user=user, author=OuterRef('pk'))
+                )
+            )
+        return queryset
+
     @action(
         methods=(
             'post',
         ),
         detail=True,
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        throttle_classes=(SubscribeThrottle,)
     )
     def subscribe(self, request, id):
         """Создание подписки"""
         serializer = SubscribePostSerializer(
             data={
-                'author': id,
-                'user': request.user.id
+                'author': id
             },
             context={
                 'request': request
@@ -72,12 +128,11 @@ class UserViewSet(UserViewSet):
     @subscribe.mapping.delete
     def delete_subscribe(self, request, id):
         """Удаление подписки"""
-        subscribe = Subscribe.objects.filter(
+        deleted, _ = Subscribe.objects.filter(
             author_id=id,
             user=request.user.id
-        )
-        if subscribe.exists():
-            subscribe.delete()
+        ).delete()
+        if deleted:
             return Response(
                 data={'detail': f'{id} удалён из подписок.'},
                 status=HTTPStatus.NO_CONTENT
@@ -87,6 +142,29 @@ class UserViewSet(UserViewSet):
             status=HTTPStatus.BAD_REQUEST
         )
 
+    def subscription_recipes(self):
+        """Превью рецептов подписки одним запросом на страницу.
+
+        recipes_limit применяется в prefetch оконной функцией,
+        свёрнутым рецептам нужны только id.
+        """
+        recipes = Recipe.objects.only(
+            'id',
+            'author',
+            'created',
+            *(
+                ('name', 'image', 'cooking_time')
+                if self.expands('recipes') else ()
+            )
+        )
+        try:
+            recipes_limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return recipes
+        if recipes_limit < 0:
+            return recipes
+        return recipes[:recipes_limit]
+
     @action(
         methods=('get',),
         permission_classes=(IsAuthenticated,),
@@ -97,19 +175,89 @@ class UserViewSet(UserViewSet):
 
         queryset = User.objects.filter(
             publisher__user_id=request.user.id
+        ).only(
+            'id',
+            *(name for name in self.user_columns if self.wants(name))
         )
+        if self.wants('is_subscribed'):
+            queryset = queryset.annotate(is_subscribed=Value(True))
+        if self.wants('recipes_count'):
+            # GROUP BY отключает сортировку из Meta модели.
+            queryset = queryset.annotate(
+                recipes_count=Count('recipes')
+            ).order_by(*User._meta.ordering)
+        if self.wants('recipes'):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'recipes',
+                    queryset=self.subscription_recipes(),
+                    to_attr='recipe_previews'
+                )
+            )
         page = self.paginate_queryset(queryset)
         serializer = SubscribeListSerializer(
             page,
-            context={'request': request},
+            context=self.get_serializer_context(),
             many=True
         )
         return self.get_paginated_response(serializer.data)
 
+    @action(
+        methods=('get',),
+        detail=False
+    )
+    def directory(self, request):
+        """Компактный список пользователей для автодополнения.
+
+        Один запрос без подсчёта страниц и флагов подписки,
+        не больше USER_DIRECTORY_LIMIT записей в порядке
+        индекса user_username_lower_idx.
+        """
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = USER_DIRECTORY_LIMIT
+        limit = min(max(limit, 1), USER_DIRECTORY_LIMIT)
+        users = self.filter_queryset(User.objects.all()).order_by(
+            Lower('username'),
+            'id'
+        ).values('id', 'username', 'first_name', 'last_name')[:limit]
+        return Response(list(users))
+
+    @action(
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        detail=False,
+        url_path='me/inbox'
+    )
+    def inbox(self, request):
+        """Новые рецепты авторов из подписок, от новых к старым."""
+        queryset = InboxItem.objects.filter(
+            user=request.user
+        ).select_related('recipe').only(
+            'id',
+            'created',
+            'recipe__id',
+            'recipe__name',
+            'recipe__image',
+            'recipe__cooking_time'
+        )
+        paginator = InboxPaginator()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = InboxItemSerializer(
+            page,
+            context=self.get_serializer_context(),
+            many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin,
+                        PrecompressedListMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Вьюсет для ингредиетов."""
 
+    cache_prefix = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
@@ -120,69 +268,311 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReplicaReadMixin,
+                 PrecompressedListMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """Вьюсет работы с тэгами"""
 
+    cache_prefix = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin,
+                    FieldSelectionMixin,
+                    ConditionalGetMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами"""
 
-    queryset = Recipe.objects.all().select_related(
-        'author'
-    ).prefetch_related(
-        'tags',
-        'ingredients'
-    )
+    queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAuthenticadedReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilterSet
+    read_actions = ('list', 'retrieve', 'match', 'changes')
+    # Колонки рецепта, которые читает каждое поле ответа.
+    field_columns = {
+        'id': ('id',),
+        'name': ('name',),
+        'image': ('image',),
+        'text': ('text',),
+        'cooking_time': ('cooking_time',),
+    }
+    author_columns = (
+        'author__email',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+    )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('feed') == FEED_FOLLOWING:
+                self._paginator = FeedPaginator()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
 
     def get_queryset(self):
+        """Читает только колонки и связи запрошенных полей.
+
+        created, updated и author_id нужны всегда: для сортировки,
+        курсоров ленты и синхронизации и проверки прав. Свёрнутые
+        до id автор, тэги и ингредиенты не требуют join и выборки
+        связанных строк.
+        """
         queryset = super().get_queryset()
+        if self.expands('author'):
+            queryset = queryset.select_related('author')
+        if self.action in self.read_actions:
+            queryset = queryset.only(
+                'created',
+                'updated',
+                'author',
+                *chain.from_iterable(
+                    columns for name, columns in self.field_columns.items()
+                    if self.wants(name)
+                ),
+                *(self.author_columns if self.expands('author') else ())
+            )
+        if self.wants('tags'):
+            queryset = queryset.prefetch_related(
+                'tags' if self.expands('tags')
+                else Prefetch('tags', queryset=Tag.objects.only('id'))
+            )
+        if self.wants('ingredients'):
+            ingredients = IngredientForRecipe.objects.all()
+            if self.expands('ingredients'):
+                ingredients = ingredients.select_related('ingredients')
+            queryset = queryset.prefetch_related(
+                Prefetch('ingredient_list', queryset=ingredients)
+            )
         user = self.request.user
         if user.is_anonymous:
             return queryset
-        favorite = Subquery(
-            Favorite.objects.filter(
-                user=self.request.user,
-                recipe=OuterRef('pk')
+        return queryset.annotate(**self.user_flags(user))
+
+    def user_relations(self):
+        """Связи пользователя, от которых зависят флаги в ответе.
+
+        Флаг, модель связи и её поле, сопоставляемое с рецептом.
+        """
+        relations = []
+        if self.wants('is_favorited'):
+            relations.append(('is_favorited', Favorite, 'recipe', 'pk'))
+        if self.wants('is_in_shopping_cart'):
+            relations.append(
+                ('is_in_shopping_cart', ShoppingCart, 'recipe', 'pk')
             )
-        )
-        shopping = Subquery(
-            ShoppingCart.objects.filter(
-                user=self.request.user,
-                recipe=OuterRef('pk')
+        if self.expands('author'):
+            relations.append(
+                ('author_is_subscribed', Subscribe, 'author', 'author')
             )
+        return relations
+
+    def user_flags(self, user):
+        return {
+            name: Exists(model.objects.filter(
+                user=user,
+                **{field: OuterRef(outer)}
+            ))
+            for name, model, field, outer in self.user_relations()
+        }
+
+    def get_etag_parts(self):
+        """Версия рецепта или страницы без выборки и сериализации.
+
+        Для рецепта - его updated, данные автора и флаги пользователя.
+        Для списка - число рецептов, max(updated) отфильтрованного
+        набора и max(updated) их авторов, а также число и max(id)
+        избранного, корзины и подписок пользователя: добавление меняет
+        max(id), удаление - число.
+        Для популярных - ещё и время последнего сброса рейтинга.
+        """
+        user = self.request.user
+        if self.action == 'retrieve':
+            flags = self.user_flags(user) if user.is_authenticated else {}
+            try:
+                return Recipe.objects.filter(
+                    pk=self.kwargs['pk']
+                ).annotate(**flags).values_list(
+                    'updated',
+                    *self.author_columns,
+                    *flags
+                ).first()
+            except (TypeError, ValueError):
+                return None
+        version = self.filter_queryset(
+            Recipe.objects.all()
+        ).order_by().aggregate(
+            count=Count('pk'),
+            updated=Max('updated'),
+            authors=Max('author__updated')
         )
-        queryset = queryset.annotate(
-            is_favorited=Exists(favorite),
-            is_in_shopping_cart=Exists(shopping)
+        parts = list(version.values())
+        if self.request.query_params.get('ordering') == TRENDING:
+            parts.append(
+                RecipeScore.objects.aggregate(Max('updated'))['updated__max']
+            )
+        if user.is_authenticated:
+            for _, model, _, _ in self.user_relations():
+                parts.extend(model.objects.filter(user=user).aggregate(
+                    count=Count('pk'),
+                    last=Max('pk')
+                ).values())
+        return parts
+
+    def get_facets(self):
+        """Число рецептов по тэгам и интервалам времени приготовления.
+
+        Все счётчики для текущих фильтров считаются одним запросом
+        условных COUNT по рецептам из подзапроса pk IN (...), а не
+        отдельным COUNT на каждый тэг.
+        """
+        recipes = Recipe.objects.filter(pk__in=self.filter_queryset(
+            Recipe.objects.all()
+        ).order_by().values('pk'))
+        tags = list(Tag.objects.values_list('pk', 'slug'))
+        counts = recipes.aggregate(
+            **{
+                f'tag_{pk}': Count('tags', filter=Q(tags=pk))
+                for pk, _ in tags
+            },
+            **{
+                f'time_{low}_{high}': Count(
+                    'pk',
+                    filter=Q(cooking_time__range=(low, high)),
+                    distinct=True
+                )
+                for low, high in COOKING_TIME_BUCKETS
+            }
         )
-        return queryset
+        return {
+            'tags': {slug: counts[f'tag_{pk}'] for pk, slug in tags},
+            'cooking_time': [
+                {
+                    'min': low,
+                    'max': high,
+                    'count': counts[f'time_{low}_{high}'],
+                }
+                for low, high in COOKING_TIME_BUCKETS
+            ],
+        }
+
+    def list(self, request, *args, **kwargs):
+        """Список рецептов; с ?facets=1 - ещё и счётчики фильтров."""
+        response = super().list(request, *args, **kwargs)
+        if (request.query_params.get('facets') in ('1', 'true')
+                and response.status_code == HTTPStatus.OK):
+            response.data['facets'] = self.get_facets()
+        return response
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
         return RecipeSerializer
 
+    @action(
+        methods=('get',),
+        detail=False,
+    )
+    def match(self, request):
+        """Action для подбора рецептов по имеющимся ингредиентам.
+
+        Рецепты ранжируются по доле своих ингредиентов,
+        которые есть у пользователя.
+        """
+        params = IngredientMatchSerializer(
+            data={'ingredients': request.query_params.getlist('ingredients')}
+        )
+        params.is_valid(raise_exception=True)
+        # numpy загружается при первом подборе, а не в каждом manage.py.
+        from recipes.matching import get_ingredient_index
+        recipe_ids, coverage = get_ingredient_index().match(
+            params.validated_data['ingredients']
+        )
+        positions = self.paginate_queryset(range(len(recipe_ids)))
+        recipes = self.get_queryset().in_bulk(
+            recipe_ids[positions].tolist()
+        )
+        page = []
+        for position in positions:
+            recipe = recipes.get(int(recipe_ids[position]))
+            if recipe is not None:
+                recipe.coverage = float(coverage[position])
+                page.append(recipe)
+        serializer = RecipeMatchSerializer(
+            page,
+            context=self.get_serializer_context(),
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=('get',),
+        detail=False,
+    )
+    def changes(self, request):
+        """Action для синхронизации: изменённые и удалённые рецепты.
+
+        Клиент передаёт в since токен из прошлого ответа и получает
+        рецепты, изменённые после него, в порядке (updated, id),
+        а также id удалённых рецептов.
+        """
+        changed, deleted, token, has_more = ChangesPaginator().paginate(
+            request,
+            self.get_queryset(),
+            RecipeTombstone.objects.all()
+        )
+        serializer = RecipeReadSerializer(
+            changed,
+            context=self.get_serializer_context(),
+            many=True
+        )
+        return Response({
+            'since': token,
+            'has_more': has_more,
+            'changed': serializer.data,
+            'deleted': deleted,
+        })
+
+    @action(
+        methods=('get',),
+        detail=True,
+    )
+    def similar(self, request, pk):
+        """Action для отображения похожих рецептов."""
+        from recipes.similarity import similarity_index
+        recipe = get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+        recipe_ids = similarity_index.similar(recipe.pk)
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        serializer = ShortRecipeSerializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            context={'request': request},
+            many=True
+        )
+        return Response(serializer.data)
+
     @staticmethod
     def favorite_cart_add(serializer_class, request, id):
         """Статик добавления рецепта в избранное/корзину."""
         serializer = serializer_class(
             data={
-                'recipe': id,
-                'user': request.user.id
+                'recipe': id
             },
             context={
                 'request': request
             },
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        instance = serializer.save()
+        record_event(
+            instance._meta.model_name,
+            instance.user_id,
+            instance.recipe_id
+        )
         return Response(
             data=serializer.data,
             status=HTTPStatus.CREATED
@@ -190,13 +580,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @staticmethod
     def favorite_cart_delete(cls, request, pk):
-        """Статик удаления рецепта из избранного/корзины"""
-        obj = cls.objects.filter(
+        """Статик удаления рецепта из избранного/корзины.
+
+        У моделей нет каскадов и сигналов удаления, поэтому delete()
+        выполняется одним запросом DELETE, а по числу удалённых строк
+        выбирается ответ.
+        """
+        deleted, _ = cls.objects.filter(
             recipe=pk,
             user=request.user.id
-        )
-        if obj.exists():
-            obj.delete()
+        ).delete()
+        if deleted:
             return Response(
                 data={
                     'detail':
@@ -218,6 +612,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         ),
         detail=True,
         permission_classes=(IsAuthenticated,),
+        throttle_classes=(FavoriteThrottle,)
     )
     def favorite(self, request, pk):
         """Action для добавления рецепта в избранное."""
@@ -232,7 +627,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             'post',
         ),
         detail=True,
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        throttle_classes=(ShoppingCartThrottle,)
     )
     def shopping_cart(self, request, pk):
         """Action для добавления рецепта в список покупок."""
@@ -243,6 +639,26 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Удаление рецепта из списка покупок."""
         return self.favorite_cart_delete(ShoppingCart, request, pk)
 
+    @action(
+        methods=('delete',),
+        detail=False,
+        url_path='shopping_cart',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_clear(self, request):
+        """Удаление списка рецептов или всей корзины одним запросом.
+
+        Очистка идемпотентна: уже пустая корзина - тоже успех.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        shopping_cart = ShoppingCart.objects.filter(user=request.user)
+        recipes = serializer.validated_data.get('recipes')
+        if recipes is not None:
+            shopping_cart = shopping_cart.filter(recipe_id__in=recipes)
+        shopping_cart.delete()
+        return Response(status=HTTPStatus.NO_CONTENT)
+
     @staticmethod
     def create_shopping_cart(user, ingredients):
         shopping_cart = [
@@ -254,15 +670,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 ' '.join(
                     map(
                         str,
-                        ingredient.values()
+                        ingredient
                     )
                 ) + '\n'
             )
-        response = FileResponse(shopping_cart, content_type='text')
-        response['Content-Disposition'] = (
-            'attachment; filename={file_name}'.format(file_name=file_name)
+        return deliver_file(
+            ''.join(shopping_cart).encode(),
+            file_name,
+            'text/plain; charset=utf-8'
         )
-        return response
 
     @action(
         methods=('get',),
@@ -270,16 +686,23 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def download_shopping_cart(self, request):
-        """Action для выгрузки списка покупок."""
+        """Action для выгрузки списка покупок.
+
+        С параметром merge=1 количества приводятся к каноническим
+        единицам и одинаковые ингредиенты складываются.
+        """
         user = request.user
         ingredients = IngredientForRecipe.objects.filter(
             recipe__shoppingcart__user=request.user
-        ).values(
+        ).values_list(
             'ingredients__name',
             'ingredients__measurement_unit',
         ).annotate(
-            recipe__shoppingcart__user=Sum('amount')
+            total=Sum('amount')
         ).order_by(
             'ingredients__name'
         )
+        if request.query_params.get('merge') in ('1', 'true'):
+            from recipes.units import normalize_amounts
+            ingredients = normalize_amounts(ingredients)
         return self.create_shopping_cart(user, ingredients)
@@ -0,0 +1,552 @@
+"""Сценарии команды benchmark.
+
+Сценарий - генератор: наполняет пустую тестовую БД синтетическими
+данными и отдаёт строки с результатами. Размеры по умолчанию -
+те, на которых снимались цифры в описаниях изменений, --scale
+уменьшает их для быстрой проверки.
+"""
+import random
+import statistics
+import subprocess
+import sys
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.compression import brotli, compress
+from api.filters import RecipeFilterSet
+from api.renderers import ORJSONRenderer
+from api.serializers import IngredientSerializer, RecipeReadSerializer
+from api.views import RecipeViewSet
+from foodgram.constants import BENCHMARK_BATCH_SIZE
+from recipes.management.commands.profile_imports import BOOT_SCRIPT
+from recipes.models import (Favorite,
+                            Ingredient,
+                            IngredientForRecipe,
+                            Recipe,
+                            ShoppingCart,
+                            Tag)
+from recipes.partitioning import partition_names
+from users.models import Subscribe, User
+
+SCENARIOS = {}
+
+
+def scenario(name, database=True):
+    """Регистрирует сценарий; database=False - без тестовой БД."""
+    def register(func):
+        SCENARIOS[name] = (func, database)
+        return func
+    return register
+
+
+def median_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def scaled(count, scale):
+    return max(1, round(count * scale))
+
+
+def seed_users(count, prefix='author'):
+    User.objects.bulk_create(
+        (
+            User(
+                username=f'{prefix}{number}',
+                email=f'{prefix}{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия'
+            )
+            for number in range(count)
+        ),
+        batch_size=BENCHMARK_BATCH_SIZE
+    )
+    return list(User.objects.filter(username__startswith=prefix))
+
+
+def seed_recipes(authors, count, text='Описание'):
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author=authors[number % len(authors)],
+                name=f'Рецепт {number}',
+                image='recipes/recipe.png',
+                text=text,
+                cooking_time=1 + number % 120
+            )
+            for number in range(count)
+        ),
+        batch_size=BENCHMARK_BATCH_SIZE
+    )
+    return list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+
+
+def load_catalog():
+    """Справочник ингредиентов и тэгов из data/, как при развёртывании."""
+    call_command('load_csv', stdout=StringIO())
+    return list(Ingredient.objects.values_list('pk', flat=True))
+
+
+def seed_ingredients(recipes, ingredients, per_recipe):
+    """По per_recipe или per_recipe + 1 ингредиентов на рецепт."""
+    rng = random.Random(0)
+    IngredientForRecipe.objects.bulk_create(
+        (
+            IngredientForRecipe(
+                recipe_id=recipe,
+                ingredients_id=ingredient,
+                amount=rng.randint(1, 500)
+            )
+            for number, recipe in enumerate(recipes)
+            for ingredient in rng.sample(
+                ingredients,
+                per_recipe + number % 2
+            )
+        ),
+        batch_size=BENCHMARK_BATCH_SIZE
+    )
+
+
+def seed_tags(recipes, per_recipe=2):
+    tags = list(Tag.objects.values_list('pk', flat=True))
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(
+                recipe_id=recipe,
+                tag_id=tags[(number + shift) % len(tags)]
+            )
+            for number, recipe in enumerate(recipes)
+            for shift in range(min(per_recipe, len(tags)))
+        ),
+        batch_size=BENCHMARK_BATCH_SIZE
+    )
+
+
+def seed_reader(authors, recipes):
+    """Читатель с подписками, избранным и корзиной."""
+    reader = User.objects.create(
+        username='reader',
+        email='reader@example.com'
+    )
+    Subscribe.objects.bulk_create(
+        (Subscribe(user=reader, author=author) for author in authors[::2]),
+        batch_size=BENCHMARK_BATCH_SIZE
+    )
+    for model, step in ((Favorite, 3), (ShoppingCart, 5)):
+        model.objects.bulk_create(
+            (
+                model(user=reader, recipe_id=recipe)
+                for recipe in recipes[::step]
+            ),
+            batch_size=BENCHMARK_BATCH_SIZE
+        )
+    return reader
+
+
+def seed_recipe_page(scale):
+    """Каталог и 500 рецептов; возвращает данные страницы из 50."""
+    ingredients = load_catalog()
+    authors = seed_users(50)
+    recipes = seed_recipes(authors, scaled(500, scale))
+    seed_tags(recipes)
+    seed_ingredients(recipes, ingredients, 6)
+    return APIClient().get('/api/recipes/?limit=50').data
+
+
+def recipe_view(user, query=''):
+    """Вьюсет рецептов для list, как при запросе /api/recipes/?query."""
+    request = Request(APIRequestFactory().get(f'/api/recipes/?{query}'))
+    request.user = user
+    return RecipeViewSet(
+        request=request,
+        action='list',
+        format_kwarg=None,
+        kwargs={}
+    )
+
+
+def selected_bytes(func):
+    """Запросы func и объём прочитанных ими строк, в байтах.
+
+    Каждый SELECT выполняется повторно, и значения колонок всех
+    строк суммируются: строки - по длине в UTF-8, прочие значения -
+    по длине текстового вида.
+    """
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    total = 0
+    with connection.cursor() as cursor:
+        for query in queries:
+            cursor.execute(query['sql'])
+            for row in cursor.fetchall():
+                total += sum(
+                    len(value.encode()) if isinstance(value, str)
+                    else len(str(value)) if value is not None else 0
+                    for value in row
+                )
+    return len(queries), total
+
+
+def authenticated_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def count_queries(func):
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+@scenario('feed')
+def feed(repeat, scale):
+    """Лента подписок: читатель подписан на 1500 авторов, 20000 рецептов."""
+    authors = seed_users(scaled(1500, scale))
+    recipes = seed_recipes(authors, scaled(20000, scale))
+    reader = User.objects.create(
+        username='reader',
+        email='reader@example.com'
+    )
+    Subscribe.objects.bulk_create(
+        (Subscribe(user=reader, author=author) for author in authors),
+        batch_size=BENCHMARK_BATCH_SIZE
+    )
+    yield f'Авторов: {len(authors)}, рецептов: {len(recipes)}'
+
+    request = Request(APIRequestFactory().get('/api/recipes/'))
+    request.user = reader
+    page_ids = RecipeFilterSet(
+        {'feed': 'following'},
+        Recipe.objects.all(),
+        request=request
+    ).qs.order_by('-created', '-id').values_list('id', flat=True)[:20]
+    yield (
+        'Запрос id страницы ленты: '
+        f'{median_ms(lambda: list(page_ids.all()), repeat):.2f} мс'
+    )
+
+    client = authenticated_client(reader)
+    url = '/api/recipes/?feed=following&limit=20'
+    next_url = client.get(url).json()['next'] or url
+    yield (
+        'Первая страница ленты: '
+        f'{median_ms(lambda: client.get(url), repeat):.2f} мс'
+    )
+    yield (
+        'Следующая страница по курсору: '
+        f'{median_ms(lambda: client.get(next_url), repeat):.2f} мс'
+    )
+    queries = count_queries(lambda: client.get(url))
+    yield f'Запросов к БД на страницу: {queries}'
+
+
+@scenario('match')
+def match(repeat, scale):
+    """Подбор по ингредиентам: 100000 рецептов, ~650000 строк состава."""
+    from recipes.matching import IngredientIndex, get_ingredient_index
+
+    ingredients = load_catalog()
+    recipes = seed_recipes(seed_users(100), scaled(100000, scale))
+    seed_ingredients(recipes, ingredients, 6)
+    yield (
+        f'Рецептов: {len(recipes)}, '
+        f'строк состава: {IngredientForRecipe.objects.count()}'
+    )
+    index = IngredientIndex.build()
+    size = sum(
+        array.nbytes
+        for array in (index.recipe_ids, index.totals, index.postings,
+                      index.ingredient_ids, index.indptr)
+    )
+    yield (
+        'Построение индекса: '
+        f'{median_ms(IngredientIndex.build, min(repeat, 5)):.0f} мс, '
+        f'{size / 2 ** 20:.1f} МБ'
+    )
+    wanted = random.Random(1).sample(ingredients, 5)
+    yield (
+        'Ранжирование по 5 ингредиентам: '
+        f'{median_ms(lambda: index.match(wanted), repeat):.2f} мс'
+    )
+    get_ingredient_index()
+    client = APIClient()
+    url = '/api/recipes/match/?limit=10&' + '&'.join(
+        f'ingredients={pk}' for pk in wanted
+    )
+    yield (
+        'Страница из 10 рецептов: '
+        f'{median_ms(lambda: client.get(url), repeat):.2f} мс'
+    )
+    grouped = Recipe.objects.annotate(
+        matched=Count(
+            'ingredient_list',
+            filter=Q(ingredient_list__ingredients__in=wanted)
+        ),
+        total=Count('ingredient_list')
+    ).filter(matched__gt=0).annotate(
+        coverage=Cast('matched', FloatField()) / F('total')
+    ).order_by('-coverage', '-matched', '-pk').values_list('pk', flat=True)
+    yield (
+        'То же ранжирование группировкой в SQL: '
+        f'{median_ms(lambda: list(grouped[:10]), min(repeat, 5)):.0f} мс'
+    )
+
+
+@scenario('serializer')
+def serializer(repeat, scale):
+    """Вывод рецептов: страница из 50 рецептов с тэгами и составом."""
+    ingredients = load_catalog()
+    authors = seed_users(50)
+    recipes = seed_recipes(authors, scaled(500, scale))
+    seed_tags(recipes)
+    seed_ingredients(recipes, ingredients, 6)
+    reader = seed_reader(authors, recipes)
+    for title, user in (('Читатель', reader), ('Аноним', AnonymousUser())):
+        view = recipe_view(user)
+        page = list(view.get_queryset().order_by('-created', '-id')[:50])
+        context = view.get_serializer_context()
+        serializer = RecipeReadSerializer(context=context)
+        manual = median_ms(
+            lambda: RecipeReadSerializer(
+                page,
+                many=True,
+                context=context
+            ).data,
+            repeat
+        )
+        nested = median_ms(
+            lambda: [
+                serializers.Serializer.to_representation(serializer, recipe)
+                for recipe in page
+            ],
+            repeat
+        )
+        yield (
+            f'{title}, на рецепт: {manual / len(page) * 1000:.0f} мкс, '
+            'через вложенные сериалайзеры DRF: '
+            f'{nested / len(page) * 1000:.0f} мкс'
+        )
+    client = authenticated_client(reader)
+    queries = count_queries(lambda: client.get('/api/recipes/?limit=50'))
+    yield f'Запросов к БД на страницу из 50 рецептов: {queries}'
+
+
+@scenario('json')
+def json(repeat, scale):
+    """JSON-рендеринг: каталог ингредиентов и страница из 50 рецептов."""
+    page = seed_recipe_page(scale)
+    catalog = IngredientSerializer(Ingredient.objects.all(), many=True).data
+    for title, data in (('Каталог ингредиентов', catalog),
+                        ('Страница из 50 рецептов', page)):
+        stdlib = JSONRenderer().render(data)
+        fast = ORJSONRenderer().render(data)
+        yield (
+            f'{title} ({len(stdlib)} байт): JSONRenderer '
+            f'{median_ms(lambda: JSONRenderer().render(data), repeat):.2f} '
+            'мс, ORJSONRenderer '
+            f'{median_ms(lambda: ORJSONRenderer().render(data), repeat):.2f}'
+            f' мс, вывод {"совпадает" if stdlib == fast else "отличается"}'
+        )
+
+
+@scenario('compression')
+def compression(repeat, scale):
+    """Сжатие ответов и кэш сжатого каталога ингредиентов."""
+    seed_recipe_page(scale)
+    client = APIClient()
+    encodings = ('identity', 'gzip') + (('br',) if brotli else ())
+
+    def get(url, encoding):
+        return client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+
+    for title, url in (('Каталог ингредиентов', '/api/ingredients/'),
+                       ('Страница из 50 рецептов', '/api/recipes/?limit=50')):
+        sizes = ', '.join(
+            f'{encoding} {len(get(url, encoding).content)}'
+            for encoding in encodings
+        )
+        yield f'{title}, байт: {sizes}'
+    content = get('/api/ingredients/', 'identity').content
+    for encoding in encodings[1:]:
+        yield (
+            f'Сжатие каталога {encoding} на каждый запрос: '
+            f'{median_ms(lambda: compress(content, encoding), repeat):.2f} мс'
+        )
+    encoding = encodings[-1]
+
+    def uncached():
+        cache.clear()
+        get('/api/ingredients/', encoding)
+
+    cached = median_ms(lambda: get('/api/ingredients/', encoding), repeat)
+    yield (
+        f'Запрос каталога ({encoding}) из кэша: {cached:.2f} мс, '
+        f'без кэша: {median_ms(uncached, repeat):.2f} мс'
+    )
+
+
+@scenario('boot', database=False)
+def boot(repeat, scale):
+    """Старт приложения в отдельных процессах Python."""
+    check = (sys.executable, str(settings.BASE_DIR / 'manage.py'), 'check')
+    started = median_ms(
+        lambda: subprocess.run(check, check=True, capture_output=True),
+        repeat
+    )
+    yield f'manage.py check: {started:.0f} мс'
+    out = StringIO()
+    call_command('profile_imports', limit=0, stdout=out)
+    yield f'profile_imports: {out.getvalue().splitlines()[0]}'
+    loaded = subprocess.run(
+        (
+            sys.executable,
+            '-c',
+            BOOT_SCRIPT + ';import sys;print("numpy" in sys.modules)'
+        ),
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout.strip() == 'True'
+    yield f'numpy при старте воркера: {"" if loaded else "не "}загружен'
+
+
+@scenario('fields')
+def fields(repeat, scale):
+    """Выборка колонок для ответа: 2000 рецептов, страница из 20."""
+    ingredients = load_catalog()
+    authors = seed_users(50)
+    recipes = seed_recipes(
+        authors,
+        scaled(2000, scale),
+        text='Нарезать, смешать и запекать 40 минут.'
+    )
+    seed_tags(recipes)
+    seed_ingredients(recipes, ingredients, 6)
+    client = authenticated_client(seed_reader(authors, recipes))
+    card = (
+        'id,name,image,cooking_time,author,tags,'
+        'is_favorited,is_in_shopping_cart'
+    )
+    for title, url in (
+        ('Список', '/api/recipes/?limit=20'),
+        ('Рецепт', f'/api/recipes/{recipes[0]}/'),
+        ('Карточки ?fields=', f'/api/recipes/?limit=20&fields={card}'),
+    ):
+        response = client.get(url)
+        count, total = selected_bytes(lambda: client.get(url))
+        yield (
+            f'{title}: запросов {count}, прочитано {total} байт, '
+            f'ответ {len(response.content)} байт, '
+            f'{median_ms(lambda: client.get(url), repeat):.2f} мс'
+        )
+
+
+def seed_recipe_users(model, users, recipes, rows):
+    """rows строк model: у каждого пользователя rows / users рецептов.
+
+    Строки генерируются в PostgreSQL через generate_series, без
+    передачи данных из Python. id пользователей и рецептов идут
+    подряд: они только что созданы bulk_create. Шаг 7919 взаимно
+    прост с числом рецептов, поэтому рецепты одного пользователя
+    не повторяются.
+    """
+    per_user = max(1, min(rows // len(users), len(recipes)))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO '
+            f'{connection.ops.quote_name(model._meta.db_table)} '
+            '(user_id, recipe_id) '
+            'SELECT %s + n / %s, %s + (n * 7919) %% %s '
+            'FROM generate_series(0, %s - 1) AS n '
+            'ON CONFLICT DO NOTHING',
+            [min(users), per_user, min(recipes), len(recipes),
+             per_user * len(users)]
+        )
+
+
+def vacuum_ms(model):
+    """VACUUM (ANALYZE) каждой секции: суммарное и наибольшее время."""
+    table = model._meta.db_table
+    timings = []
+    with connection.cursor() as cursor:
+        for relation in partition_names(connection, table) or [table]:
+            started = time.perf_counter()
+            cursor.execute(
+                'VACUUM (ANALYZE) ' + connection.ops.quote_name(relation)
+            )
+            timings.append((time.perf_counter() - started) * 1000)
+    return sum(timings), max(timings)
+
+
+@scenario('partitions')
+def partitions(repeat, scale):
+    """Избранное и корзина без секций и с 16 секциями по user_id.
+
+    Только PostgreSQL. По умолчанию 1000000 строк в каждой таблице,
+    --scale 100 - объём из исходной задачи (100 млн строк).
+    """
+    if connection.vendor != 'postgresql':
+        raise CommandError('Сценарий partitions требует PostgreSQL')
+    users = [user.pk for user in seed_users(scaled(10000, scale), 'user')]
+    recipes = seed_recipes(seed_users(100), scaled(10000, scale))
+    rows = scaled(1000000, scale)
+    for model in (Favorite, ShoppingCart):
+        seed_recipe_users(model, users, recipes, rows)
+    rng = random.Random(0)
+    probes = [
+        (rng.choice(users), rng.choice(recipes))
+        for _ in range(max(repeat, 1))
+    ]
+    yield f'Пользователей: {len(users)}, рецептов: {len(recipes)}'
+    layouts = (('без секций', None), ('16 секций', 16))
+    for step, (layout, partitions) in enumerate(layouts):
+        if partitions is not None:
+            started = time.perf_counter()
+            call_command(
+                'partition_recipe_user',
+                partitions=partitions,
+                stdout=StringIO()
+            )
+            yield (
+                'Перестроение таблиц: '
+                f'{time.perf_counter() - started:.1f} с'
+            )
+        for model in (Favorite, ShoppingCart):
+            pairs = iter(probes)
+
+            def probe():
+                user, recipe = next(pairs)
+                return model.objects.filter(
+                    user_id=user,
+                    recipe_id=recipe
+                ).exists()
+
+            probe_ms = median_ms(probe, len(probes))
+            # Каждый раз удаляются строки других пользователей.
+            model.objects.filter(user_id__in=users[step::10]).delete()
+            total, longest = vacuum_ms(model)
+            yield (
+                f'{model._meta.db_table}, {layout}: '
+                f'{model.objects.count()} строк, проверка Exists '
+                f'{probe_ms:.3f} мс, VACUUM после удаления 10% строк '
+                f'{total:.0f} мс (самая долгая секция {longest:.0f} мс)'
+            )
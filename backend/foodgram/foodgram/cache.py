@@ -0,0 +1,31 @@
+"""Версии данных в общем кэше.
+
+Закэшированные данные не удаляются поштучно: в их ключ входит
+номер версии, и после изменения достаточно увеличить его, чтобы
+все воркеры перестали читать старые записи.
+"""
+from django.core.cache import cache
+
+
+def _version_key(name):
+    return f'{name}:version'
+
+
+def get_version(name):
+    return cache.get_or_set(_version_key(name), 1, None)
+
+
+def bump_version(name):
+    key = _version_key(name)
+    cache.add(key, 1, None)
+    cache.incr(key)
+
+
+def reference_cache_key(prefix, *parts):
+    version = get_version(f'reference:{prefix}')
+    return ':'.join(map(str, ('reference', prefix, version, *parts)))
+
+
+def invalidate_reference_cache(prefix):
+    """Сбрасывает все закэшированные страницы справочника."""
+    bump_version(f'reference:{prefix}')
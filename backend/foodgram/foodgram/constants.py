@@ -4,3 +4,30 @@ MAX_VALUE_TIME = 400
 MIN_VALUE = 1
 MAX_LENGTH_EMAIL = 254
 MAX_LENGTH_PERSONAL = 150
+FEED_FOLLOWING = 'following'
+MAX_MATCH_INGREDIENTS = 100
+# Верхняя граница BigAutoField и int64 в индексе подбора.
+MAX_ID = 2 ** 63 - 1
+MATCH_INDEX_TTL = 300
+MATCH_INDEX_VERSION = 'match_index'
+SIMILAR_RECIPES_LIMIT = 10
+SIMILARITY_BATCH_SIZE = 64
+MAX_BATCH_RECIPES = 500
+LOAD_CSV_BATCH_SIZE = 1000
+BOOTSTRAP_LOCK_ID = 4_210_038
+CHANGES_PAGE_SIZE = 100
+CHANGES_MAX_PAGE_SIZE = 500
+CHANGES_SETTLE_SECONDS = 5
+MEDIA_GC_MIN_AGE = 24 * 60 * 60
+SPOOL_MAX_AGE = 60 * 60
+TRENDING = 'trending'
+TRENDING_HALF_LIFE = 24 * 60 * 60
+TRENDING_BATCH_SIZE = 5000
+TRENDING_WEIGHTS = {'favorite': 1.0, 'shoppingcart': 2.0}
+COOKING_TIME_BUCKETS = ((1, 15), (16, 30), (31, 60), (61, MAX_VALUE_TIME))
+FANOUT_BATCH_SIZE = 5000
+FANOUT_PAUSE = 0.05
+USER_SEARCH_MIN_LENGTH = 3
+USER_DIRECTORY_LIMIT = 20
+BENCHMARK_REPEAT = 21
+BENCHMARK_BATCH_SIZE = 5000
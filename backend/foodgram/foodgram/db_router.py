@@ -0,0 +1,84 @@
+"""Маршрутизация безопасных запросов API на реплики БД."""
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+# Реплика, выбранная для текущего запроса; None - основная БД.
+_replica_alias = ContextVar('replica_alias', default=None)
+_weighted_replicas = [
+    alias
+    for alias, weight in settings.DATABASE_REPLICAS.items()
+    for _ in range(weight)
+]
+_replicas = itertools.cycle(_weighted_replicas or [None])
+_down_until = {}
+
+
+def enable_replica_reads():
+    """Выбирает реплику для всех чтений запроса.
+
+    Реплика выбирается один раз, чтобы страница, count, ETag и
+    prefetch одного ответа читались с одной и той же копии данных.
+    Возвращает токен для отмены.
+    """
+    return _replica_alias.set(choose_replica())
+
+
+def reset_replica_reads(token):
+    _replica_alias.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    """Включает чтение с реплик в пределах блока."""
+    token = enable_replica_reads()
+    try:
+        yield
+    finally:
+        reset_replica_reads(token)
+
+
+def _is_available(alias):
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _down_until[alias] = (
+            time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        )
+        return False
+    return True
+
+
+def choose_replica():
+    """Взвешенный round-robin по доступным репликам.
+
+    Недоступная реплика исключается на REPLICA_RETRY_SECONDS,
+    если доступных нет - чтение идёт с основной БД.
+    """
+    for _ in range(len(_weighted_replicas)):
+        alias = next(_replicas)
+        if _is_available(alias):
+            return alias
+    return None
+
+
+class ReplicaRouter:
+    """Чтение с реплики только внутри replica_reads(), запись - в default."""
+
+    def db_for_read(self, model, **hints):
+        return _replica_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
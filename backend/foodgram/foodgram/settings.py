@@ -35,6 +35,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,6 +91,48 @@ else:
         }
     }
 
+DB_REPLICA_HOSTS = [
+    host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host
+]
+DB_REPLICA_WEIGHTS = [
+    int(weight)
+    for weight in os.getenv('DB_REPLICA_WEIGHTS', '').split(',') if weight
+]
+DATABASE_REPLICAS = {}
+for number, host in enumerate(DB_REPLICA_HOSTS):
+    alias = f'replica_{number}'
+    replica = {
+        **DATABASES['default'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    replica['NAME' if CHECKOUT else 'HOST'] = host
+    DATABASES[alias] = replica
+    DATABASE_REPLICAS[alias] = (
+        DB_REPLICA_WEIGHTS[number]
+        if number < len(DB_REPLICA_WEIGHTS) else 1
+    )
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', 30))
+
+# Кэш общий для всех воркеров: лимиты запросов, привязка к основной БД
+# после записи и кэш справочников. Вне DEBUG локальный кэш процесса
+# запрещён проверкой api.E001 (manage.py check --deploy).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', 86400))
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME':
@@ -127,6 +170,16 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Сгенерированные файлы для отдачи через X-Accel-Redirect nginx.
+SPOOL_ROOT = os.getenv('SPOOL_ROOT', os.path.join(BASE_DIR, 'spool'))
+SPOOL_URL = os.getenv('SPOOL_URL', '/spool/')
+USE_X_ACCEL_REDIRECT = os.getenv('USE_X_ACCEL_REDIRECT')
+
+SIMILARITY_INDEX_PATH = os.getenv(
+    'SIMILARITY_INDEX_PATH',
+    os.path.join(BASE_DIR, 'similarity', 'recipes.npy')
+)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
@@ -139,9 +192,22 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.LimitPaginator',
     'PAGE_SIZE': 6,
-
+    'DEFAULT_THROTTLE_RATES': {
+        'favorite': os.getenv('THROTTLE_FAVORITE', '60/min'),
+        'shopping_cart': os.getenv('THROTTLE_SHOPPING_CART', '60/min'),
+        'subscribe': os.getenv('THROTTLE_SUBSCRIBE', '30/min'),
+    },
 }
 DJOSER = {
     'LOGIN_FIELD': 'email',
@@ -0,0 +1,30 @@
+"""Настройки gunicorn.
+
+Приложение импортируется один раз в мастере до fork, воркеры
+получают уже загруженные модули через copy-on-write.
+"""
+import gc
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+# Каждый воркер держит свои индексы подбора и похожих рецептов,
+# поэтому число воркеров увеличивают явно, с учётом памяти.
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+preload_app = True
+
+# Сборщик мусора не перемешивает объекты, пока грузится приложение.
+gc.disable()
+
+
+def when_ready(server):
+    """Догружает urlconf и замораживает объекты мастера.
+
+    Без gc.freeze() первый же проход сборщика мусора в воркере
+    пишет в заголовки всех унаследованных объектов и копирует
+    разделяемые страницы памяти.
+    """
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    gc.freeze()
+    gc.enable()
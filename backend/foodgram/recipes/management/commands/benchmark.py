@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import (override_settings,
+                               setup_databases,
+                               setup_test_environment,
+                               teardown_databases,
+                               teardown_test_environment)
+
+from foodgram.benchmarks import SCENARIOS
+from foodgram.constants import BENCHMARK_REPEAT
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+class Command(BaseCommand):
+    """Замеры производительности на синтетических данных.
+
+    Как и manage.py test, сценарий работает с отдельной тестовой
+    БД, которая удаляется после замера, и с локальным кэшем
+    процесса, так что рабочие данные и общий кэш не затрагиваются.
+    Время - медиана --repeat запусков; запросы к API идут через
+    тестовый клиент DRF, и его накладные расходы входят в замер.
+    """
+    help = 'Замеры производительности на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=BENCHMARK_REPEAT,
+            help='Сколько раз повторять каждый замер'
+        )
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1.0,
+            help='Множитель объёма синтетических данных'
+        )
+
+    def handle(self, *args, **options):
+        run, database = SCENARIOS[options['scenario']]
+        setup_test_environment()
+        old_config = (
+            setup_databases(0, False, serialized_aliases=set())
+            if database else None
+        )
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                for line in run(options['repeat'], options['scale']):
+                    self.stdout.write(line)
+        finally:
+            if database:
+                teardown_databases(old_config, 0)
+            teardown_test_environment()
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+from foodgram.constants import BOOTSTRAP_LOCK_ID
+from recipes.models import BootstrapStep
+
+SEED_FILES = ('data/ingredients.csv', 'data/tags.csv')
+STATIC_IGNORE_PATTERNS = ['CVS', '.*', '*~']
+STATIC_STAMP = '.bootstrap'
+
+
+def files_digest(files):
+    """sha256 по именам и содержимому файлов."""
+    digest = hashlib.sha256()
+    for name, path in files:
+        digest.update(name.encode())
+        with open(path, 'rb') as file:
+            digest.update(hashlib.sha256(file.read()).digest())
+    return digest.hexdigest()
+
+
+class Command(BaseCommand):
+    """Подготовка окружения перед стартом gunicorn.
+
+    Миграции, загрузка csv и collectstatic выполняются только
+    если их входные данные изменились с прошлого запуска.
+    Несколько контейнеров, стартующих одновременно, выполняют
+    шаги по очереди под advisory lock PostgreSQL.
+    """
+    help = 'Миграции, начальные данные и статика без лишней работы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Выполнить все шаги без сверки отпечатков'
+        )
+
+    @contextmanager
+    def lock(self, connection):
+        if connection.vendor != 'postgresql':
+            yield
+            return
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [BOOTSTRAP_LOCK_ID])
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_advisory_unlock(%s)',
+                    [BOOTSTRAP_LOCK_ID]
+                )
+
+    def migrate(self, connection, force):
+        """Пустой план миграций означает, что схема актуальна."""
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if not plan and not force:
+            return False
+        call_command('migrate', interactive=False, verbosity=0)
+        return True
+
+    def seed(self, connection, force):
+        fingerprint = files_digest((path, path) for path in SEED_FILES)
+        if not force and BootstrapStep.objects.filter(
+            name='seed',
+            fingerprint=fingerprint
+        ).exists():
+            return False
+        call_command('load_csv')
+        BootstrapStep.objects.update_or_create(
+            name='seed',
+            defaults={'fingerprint': fingerprint}
+        )
+        return True
+
+    def static(self, connection, force):
+        """Отпечаток хранится в STATIC_ROOT рядом с собранной статикой.
+
+        Статика лежит в файловой системе контейнера или тома,
+        а не в БД, поэтому пустой том пересобирается всегда.
+        """
+        fingerprint = files_digest(sorted(
+            (path, storage.path(path))
+            for finder in get_finders()
+            for path, storage in finder.list(STATIC_IGNORE_PATTERNS)
+        ))
+        stamp = os.path.join(settings.STATIC_ROOT, STATIC_STAMP)
+        if not force and os.path.exists(stamp):
+            with open(stamp, encoding='utf-8') as file:
+                if file.read() == fingerprint:
+                    return False
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(stamp, 'w', encoding='utf-8') as file:
+            file.write(fingerprint)
+        return True
+
+    def handle(self, *args, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        steps = (
+            ('migrate', self.migrate),
+            ('seed', self.seed),
+            ('static', self.static),
+        )
+        started = time.monotonic()
+        with self.lock(connection):
+            self.stdout.write(
+                f'lock: получен за {time.monotonic() - started:.2f} с'
+            )
+            for name, step in steps:
+                step_started = time.monotonic()
+                done = step(connection, options['force'])
+                self.stdout.write(
+                    f'{name}: {"выполнен" if done else "пропущен"} '
+                    f'за {time.monotonic() - step_started:.2f} с'
+                )
+        self.stdout.write(
+            f'Всего: {time.monotonic() - started:.2f} с'
+        )
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodgram.constants import SIMILAR_RECIPES_LIMIT
+from recipes.similarity import build_similarity_index, save_similarity_index
+
+
+class Command(BaseCommand):
+    """Пересборка индекса похожих рецептов.
+
+    Запускается периодически (cron), воркеры подхватывают
+    новый файл индекса без перезапуска.
+    """
+    help = 'Пересборка индекса похожих рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=SIMILAR_RECIPES_LIMIT,
+            help='Количество похожих рецептов для каждого рецепта'
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        index = build_similarity_index(limit=options['limit'])
+        save_similarity_index(index)
+        self.stdout.write(
+            f'Индекс похожих рецептов собран: {len(index)} рецептов '
+            f'за {time.monotonic() - start:.1f} с'
+        )
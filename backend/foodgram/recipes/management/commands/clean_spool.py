@@ -0,0 +1,39 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodgram.constants import SPOOL_MAX_AGE
+
+
+class Command(BaseCommand):
+    """Удаление файлов из SPOOL_ROOT, которые nginx уже отдал.
+
+    Повторная выгрузка того же файла обновляет его mtime, поэтому
+    удаляются только файлы, которые давно никто не запрашивал.
+    """
+    help = 'Очистка каталога файлов для X-Accel-Redirect'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age',
+            type=int,
+            default=SPOOL_MAX_AGE,
+            help='Удалять файлы старше указанного числа секунд'
+        )
+
+    def handle(self, *args, **options):
+        deadline = time.time() - options['max_age']
+        removed = 0
+        for root, _, files in os.walk(settings.SPOOL_ROOT):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.stat(path).st_mtime > deadline:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+        self.stdout.write(f'Удалено файлов: {removed}')
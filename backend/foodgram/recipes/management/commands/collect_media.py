@@ -0,0 +1,66 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodgram.constants import MEDIA_GC_MIN_AGE
+from recipes.models import Recipe
+from recipes.storage import image_storage
+
+
+class Command(BaseCommand):
+    """Удаление картинок, на которые не ссылается ни один рецепт.
+
+    Одинаковые картинки хранятся одним файлом, поэтому файл живёт,
+    пока на него ссылается хотя бы один рецепт. Свежие файлы не
+    трогаются: рецепт с только что загруженной картинкой может быть
+    ещё не сохранён.
+    """
+    help = 'Сборка мусора в картинках рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=MEDIA_GC_MIN_AGE,
+            help='Не удалять файлы моложе указанного числа секунд'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, которые будут удалены'
+        )
+
+    def walk(self, directory):
+        if not image_storage.exists(directory):
+            return
+        directories, files = image_storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name)
+        for name in directories:
+            yield from self.walk(os.path.join(directory, name))
+
+    def handle(self, *args, **options):
+        upload_to = Recipe._meta.get_field('image').upload_to
+        referenced = set(
+            Recipe.objects.exclude(image='').values_list('image', flat=True)
+        )
+        deadline = time.time() - options['min_age']
+        removed = freed = 0
+        for name in self.walk(upload_to.rstrip('/')):
+            if name in referenced:
+                continue
+            path = image_storage.path(name)
+            stat = os.stat(path)
+            if stat.st_mtime > deadline:
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                image_storage.delete(name)
+            removed += 1
+            freed += stat.st_size
+        self.stdout.write(
+            f'Удалено файлов: {removed}, освобождено {freed} байт'
+            + (' (пробный запуск)' if options['dry_run'] else '')
+        )
@@ -0,0 +1,96 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodgram.constants import FANOUT_BATCH_SIZE, FANOUT_PAUSE
+from recipes.models import RecipeOutbox
+from users.models import InboxItem, Subscribe
+
+
+class Command(BaseCommand):
+    """Рассылка новых рецептов во входящие подписчиков.
+
+    Каждая пачка подписчиков - отдельная короткая транзакция:
+    записи InboxItem создаются bulk_create, а курсор записи outbox
+    сдвигается, так что прерванная рассылка продолжается с места
+    остановки. Записи outbox блокируются с SKIP LOCKED, поэтому
+    несколько воркеров не разбирают одну и ту же публикацию.
+    """
+    help = 'Рассылка новых рецептов подписчикам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=FANOUT_BATCH_SIZE,
+            help='Подписчиков в одной транзакции'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=0,
+            help='Остановиться после указанного числа записей (0 - без '
+                 'ограничения)'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=FANOUT_PAUSE,
+            help='Пауза в секундах между пачками, чтобы не занимать БД'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Ждать новых публикаций, опрашивая outbox с этим '
+                 'интервалом (0 - выйти, когда очередь пуста)'
+        )
+
+    def fanout_batch(self, batch_size):
+        """Раскладывает одну пачку; None - очередь пуста."""
+        with transaction.atomic():
+            event = RecipeOutbox.objects.select_for_update(
+                skip_locked=True,
+                of=('self',)
+            ).select_related('recipe').only(
+                'id',
+                'cursor',
+                'recipe__author_id'
+            ).order_by('pk').first()
+            if event is None:
+                return None
+            followers = list(Subscribe.objects.filter(
+                author_id=event.recipe.author_id,
+                pk__gt=event.cursor
+            ).order_by('pk').values_list('pk', 'user_id')[:batch_size])
+            InboxItem.objects.bulk_create(
+                [
+                    InboxItem(user_id=user_id, recipe_id=event.recipe_id)
+                    for _, user_id in followers
+                ],
+                ignore_conflicts=True
+            )
+            if len(followers) < batch_size:
+                event.delete()
+            else:
+                event.cursor = followers[-1][0]
+                event.save(update_fields=('cursor',))
+        return len(followers)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        delivered = 0
+        while not options['limit'] or delivered < options['limit']:
+            count = self.fanout_batch(options['batch_size'])
+            if count is None:
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            delivered += count
+            time.sleep(options['pause'])
+        self.stdout.write(
+            f'Доставлено записей: {delivered} '
+            f'за {time.monotonic() - started:.2f} с'
+        )
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodgram.constants import TRENDING_BATCH_SIZE
+from recipes.trending import flush_events
+
+
+class Command(BaseCommand):
+    """Перенос накопленных событий рейтинга в RecipeScore.
+
+    Запросы к API только пишут события, а рейтинг пересчитывает
+    эта команда: из cron или постоянно запущенным процессом с
+    --interval.
+    """
+    help = 'Пересчёт рейтинга популярных рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=TRENDING_BATCH_SIZE,
+            help='Событий в одной транзакции'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Ждать новых событий, опрашивая очередь с этим '
+                 'интервалом (0 - выйти, когда очередь пуста)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        flushed = 0
+        while True:
+            count = flush_events(options['batch_size'])
+            if count is None:
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            flushed += count
+        self.stdout.write(
+            f'Учтено событий: {flushed} '
+            f'за {time.monotonic() - started:.2f} с'
+        )
@@ -2,6 +2,8 @@ import csv
 
 from django.core.management.base import BaseCommand
 
+from foodgram.cache import invalidate_reference_cache
+from foodgram.constants import LOAD_CSV_BATCH_SIZE
 from recipes.models import Ingredient, Tag
 
 
@@ -14,18 +16,26 @@ class Command(BaseCommand):
             with open('data/ingredients.csv', 'r', encoding='utf-8') as file:
                 field_names = ['name', 'measurement_unit']
                 reader = csv.DictReader(file, fieldnames=field_names)
-                for row in reader:
-                    Ingredient.objects.get_or_create(
+                Ingredient.objects.bulk_create(
+                    (Ingredient(
                         name=row['name'],
                         measurement_unit=row['measurement_unit']
-                    )
+                    ) for row in reader),
+                    batch_size=LOAD_CSV_BATCH_SIZE,
+                    ignore_conflicts=True
+                )
             with open('data/tags.csv', 'r', encoding='utf-8') as file:
-                for row in csv.DictReader(file):
-                    Tag.objects.get_or_create(
+                Tag.objects.bulk_create(
+                    (Tag(
                         name=row['name'],
                         color=row['color'],
                         slug=row['slug']
-                    )
+                    ) for row in csv.DictReader(file)),
+                    ignore_conflicts=True
+                )
         except FileNotFoundError:
             raise FileNotFoundError('Файлы не найдены')
-        print('Данные успешно загружены')
+        # bulk_create не отправляет post_save, кэш сбрасывается вручную.
+        invalidate_reference_cache('ingredients')
+        invalidate_reference_cache('tags')
+        self.stdout.write('Данные успешно загружены')
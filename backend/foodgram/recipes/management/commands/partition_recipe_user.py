@@ -0,0 +1,101 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from recipes.models import Favorite, ShoppingCart
+from recipes.partitioning import (is_partitioned,
+                                  partition_names,
+                                  rebuild_table)
+
+MODELS = (Favorite, ShoppingCart)
+
+
+class Command(BaseCommand):
+    """Секционирование избранного и корзины и обслуживание секций.
+
+    Без аргументов показывает секции таблиц, их размер и число
+    мёртвых строк. --partitions N пересоздаёт таблицы с N секциями
+    по HASH(user_id), --partitions 0 - обычными таблицами.
+    --vacuum выполняет VACUUM ANALYZE по одной секции за раз.
+    Миграции таблицы не перестраивают: перестроение блокирует их
+    на время копирования и запускается только этой командой.
+    """
+    help = 'Секционирование Favorite и ShoppingCart по user_id'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--partitions',
+            type=int,
+            help='Пересоздать таблицы с указанным числом секций'
+        )
+        parser.add_argument(
+            '--vacuum',
+            action='store_true',
+            help='VACUUM ANALYZE каждой секции по очереди'
+        )
+
+    def relations(self, connection, table):
+        return partition_names(connection, table) or [table]
+
+    def status(self, connection):
+        with connection.cursor() as cursor:
+            for model in MODELS:
+                table = model._meta.db_table
+                self.stdout.write(
+                    f'{table}: '
+                    + ('секционирована' if is_partitioned(connection, table)
+                       else 'без секций')
+                )
+                for relation in self.relations(connection, table):
+                    cursor.execute(
+                        'SELECT pg_total_relation_size(%s), '
+                        'COALESCE(n_live_tup, 0), COALESCE(n_dead_tup, 0) '
+                        'FROM pg_class c LEFT JOIN pg_stat_user_tables s '
+                        'ON s.relid = c.oid WHERE c.relname = %s',
+                        [relation, relation]
+                    )
+                    size, live, dead = cursor.fetchone()
+                    self.stdout.write(
+                        f'  {relation}: {size} байт, строк {live}, '
+                        f'мёртвых {dead}'
+                    )
+
+    def rebuild(self, connection, partitions):
+        for model in MODELS:
+            table = model._meta.db_table
+            started = time.monotonic()
+            with connection.schema_editor() as schema_editor:
+                rebuild_table(schema_editor, model, partitions)
+            self.stdout.write(
+                f'{table}: секций {partitions} '
+                f'за {time.monotonic() - started:.2f} с'
+            )
+
+    def vacuum(self, connection):
+        """VACUUM нельзя выполнять в транзакции, каждая секция отдельно."""
+        with connection.cursor() as cursor:
+            for model in MODELS:
+                table = model._meta.db_table
+                for relation in self.relations(connection, table):
+                    started = time.monotonic()
+                    cursor.execute(
+                        'VACUUM (ANALYZE) '
+                        + connection.ops.quote_name(relation)
+                    )
+                    self.stdout.write(
+                        f'{relation}: VACUUM за '
+                        f'{time.monotonic() - started:.2f} с'
+                    )
+
+    def handle(self, *args, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Секционирование доступно только в PostgreSQL')
+        if options['partitions'] is not None:
+            if options['partitions'] < 0:
+                raise CommandError('Число секций не может быть меньше 0')
+            self.rebuild(connection, options['partitions'])
+        if options['vacuum']:
+            self.vacuum(connection)
+        self.status(connection)
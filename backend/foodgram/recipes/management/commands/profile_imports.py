@@ -0,0 +1,77 @@
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+BOOT_SCRIPT = (
+    'import django.core.wsgi, django.urls;'
+    'django.core.wsgi.get_wsgi_application();'
+    'django.urls.get_resolver().url_patterns'
+)
+
+
+class Command(BaseCommand):
+    """Сводка `python -X importtime` по загрузке приложения.
+
+    В отдельном процессе повторяет старт воркера: настройку Django,
+    создание WSGI-приложения и импорт urlconf со всеми views.
+    Время собственного импорта модулей суммируется по пакетам
+    верхнего уровня.
+    """
+    help = 'Профиль времени импорта при старте приложения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=15,
+            help='Сколько самых медленных пакетов и модулей показать'
+        )
+
+    @staticmethod
+    def parse(output):
+        """Строки importtime -> [(модуль, собственное, суммарное), ...]."""
+        modules = []
+        for line in output.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            self_time, cumulative, name = line[12:].split('|')
+            if not self_time.strip().isdigit():
+                continue
+            modules.append(
+                (name.strip(), int(self_time), int(cumulative))
+            )
+        return modules
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            (sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT),
+            capture_output=True,
+            text=True
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        modules = self.parse(result.stderr)
+        packages = defaultdict(int)
+        for name, self_time, _ in modules:
+            packages[name.split('.')[0]] += self_time
+        limit = options['limit']
+        total = sum(packages.values())
+        self.stdout.write(
+            f'Всего: {total / 1000:.1f} мс, модулей: {len(modules)}'
+        )
+        self.stdout.write('\nПакеты, собственное время:')
+        for name, self_time in sorted(
+            packages.items(),
+            key=lambda item: item[1],
+            reverse=True
+        )[:limit]:
+            self.stdout.write(f'{self_time / 1000:9.1f} мс  {name}')
+        self.stdout.write('\nМодули, время с зависимостями:')
+        for name, _, cumulative in sorted(
+            modules,
+            key=lambda module: module[2],
+            reverse=True
+        )[:limit]:
+            self.stdout.write(f'{cumulative / 1000:9.1f} мс  {name}')
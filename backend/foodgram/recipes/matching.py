@@ -0,0 +1,98 @@
+"""Подбор рецептов по имеющимся у пользователя ингредиентам."""
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+
+from foodgram.cache import get_version
+from foodgram.constants import MATCH_INDEX_TTL, MATCH_INDEX_VERSION
+from recipes.models import IngredientForRecipe
+
+
+class IngredientIndex:
+    """Инвертированный индекс ингредиент -> рецепты.
+
+    Позиции рецептов для каждого ингредиента хранятся одним массивом
+    в CSR-формате, поэтому подсчёт совпадений сводится к bincount
+    по нескольким срезам и не обращается к БД.
+    """
+
+    def __init__(self, pairs):
+        self.recipe_ids, positions = np.unique(
+            pairs[:, 0],
+            return_inverse=True
+        )
+        self.totals = np.bincount(positions, minlength=len(self.recipe_ids))
+        order = np.argsort(pairs[:, 1], kind='stable')
+        ingredients = pairs[order, 1]
+        self.postings = positions[order].astype(np.int32)
+        self.ingredient_ids, starts = np.unique(
+            ingredients,
+            return_index=True
+        )
+        self.indptr = np.append(starts, len(ingredients))
+
+    @classmethod
+    def build(cls):
+        rows = IngredientForRecipe.objects.values_list(
+            'recipe_id',
+            'ingredients_id'
+        ).iterator(chunk_size=10000)
+        pairs = np.fromiter(chain.from_iterable(rows), dtype=np.int64)
+        return cls(pairs.reshape(-1, 2))
+
+    def match(self, ingredient_ids):
+        """Возвращает id рецептов и их покрытие по убыванию покрытия."""
+        keys = np.unique(np.asarray(ingredient_ids, dtype=np.int64))
+        found = np.searchsorted(self.ingredient_ids, keys)
+        found = found[found < len(self.ingredient_ids)]
+        found = found[np.isin(self.ingredient_ids[found], keys)]
+        if not len(found):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        matched = np.bincount(
+            np.concatenate(
+                [self.postings[self.indptr[i]:self.indptr[i + 1]]
+                 for i in found]
+            ),
+            minlength=len(self.recipe_ids)
+        )
+        candidates = np.flatnonzero(matched)
+        matched = matched[candidates]
+        coverage = matched / self.totals[candidates]
+        recipe_ids = self.recipe_ids[candidates]
+        order = np.lexsort((-recipe_ids, -matched, -coverage))
+        return recipe_ids[order], coverage[order]
+
+
+_index = None
+_built_at = 0.0
+_version = None
+_lock = threading.Lock()
+
+
+def _is_stale(version):
+    return (
+        _index is None
+        or _version != version
+        or time.monotonic() - _built_at > MATCH_INDEX_TTL
+    )
+
+
+def get_ingredient_index():
+    """Индекс процесса, перестраиваемый после изменения рецептов.
+
+    Сигналы recipes.signals увеличивают версию индекса в общем
+    кэше, и каждый воркер перестраивает свою копию при следующем
+    подборе. Изменения в обход сигналов индекс подхватывает не
+    позже чем через MATCH_INDEX_TTL секунд.
+    """
+    global _index, _built_at, _version
+    version = get_version(MATCH_INDEX_VERSION)
+    if _is_stale(version):
+        with _lock:
+            if _is_stale(version):
+                _index = IngredientIndex.build()
+                _built_at = time.monotonic()
+                _version = version
+    return _index
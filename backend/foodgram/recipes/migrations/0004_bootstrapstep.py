@@ -0,0 +1,26 @@
+# Generated by Django 4.2.5 on 2026-10-19 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BootstrapStep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='Шаг')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='Отпечаток')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата выполнения')),
+            ],
+            options={
+                'verbose_name': 'Шаг запуска',
+                'verbose_name_plural': 'Шаги запуска',
+            },
+        ),
+    ]
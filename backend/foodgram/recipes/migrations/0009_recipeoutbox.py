@@ -0,0 +1,27 @@
+# Generated by Django 4.2.5 on 2026-10-19 12:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_cooking_time_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cursor', models.BigIntegerField(default=0, verbose_name='Последняя обработанная подписка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата публикации')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Рассылка рецепта',
+                'verbose_name_plural': 'Рассылки рецептов',
+            },
+        ),
+    ]
@@ -6,6 +6,7 @@ from foodgram.constants import (MAX_LENGTH,
                                 MAX_VALUE_TIME,
                                 MAX_VALUE_AMOUNT,
                                 MIN_VALUE)
+from recipes.storage import get_image_storage
 from users.models import User
 
 
@@ -80,6 +81,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='.media/',
+        storage=get_image_storage,
         verbose_name='Фото блюда',
     )
     text = models.TextField(
@@ -112,11 +114,44 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
 
     class Meta:
-        ordering = ('-created',)
+        ordering = ('-created', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=[
+                    'updated',
+                    'id'
+                ],
+                name='recipe_updated_id_idx'
+            ),
+            models.Index(
+                fields=[
+                    '-created',
+                    '-id'
+                ],
+                name='recipe_created_id_idx'
+            ),
+            models.Index(
+                fields=[
+                    'author',
+                    '-created'
+                ],
+                name='recipe_author_created_idx'
+            ),
+            models.Index(
+                fields=[
+                    'cooking_time',
+                ],
+                name='recipe_cooking_time_idx'
+            )
+        ]
 
     def __str__(self) -> str:
         return f'Автор {self.author.username} рецепта {self.name}'
@@ -164,6 +199,18 @@ class IngredientForRecipe(models.Model):
                 name='ingredients_unique'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=[
+                    'recipe',
+                ],
+                include=[
+                    'ingredients',
+                    'amount',
+                ],
+                name='ingredientforrecipe_recipe_idx'
+            )
+        ]
 
     def __str__(self):
         return f'{self.recipe} {self.ingredients} {self.amount}'
@@ -194,6 +241,15 @@ class RecipeUser(models.Model):
                 ]
             )
         ]
+        indexes = [
+            models.Index(
+                fields=[
+                    'user',
+                    'recipe'
+                ],
+                name='%(class)s_user_recipe_idx'
+            )
+        ]
 
     def __str__(self) -> str:
         return f'{self.user.username}, {self.recipe.name}'
@@ -213,3 +269,153 @@ class ShoppingCart(RecipeUser):
     class Meta(RecipeUser.Meta):
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзины покупок'
+
+
+class RecipeScore(models.Model):
+    """Модель описывающая рейтинг популярности рецепта.
+
+    score - логарифм суммы весов событий, умноженных на
+    2 ** (t / период полураспада). Рост множителя со временем
+    равносилен затуханию старых событий, поэтому хранимый score
+    не нужно пересчитывать: порядок по нему и есть текущий рейтинг.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        related_name='score',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(
+        verbose_name='Рейтинг'
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения'
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(
+                fields=[
+                    '-score',
+                    '-recipe'
+                ],
+                name='recipescore_score_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id}, {self.score}'
+
+
+class TrendingEvent(models.Model):
+    """Модель описывающая событие рейтинга, ещё не учтённое в RecipeScore.
+
+    Пишется при добавлении рецепта в избранное или корзину; команда
+    flush_trending сворачивает события пачками в RecipeScore и
+    удаляет их, так что событие не теряется при падении воркера.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(
+        verbose_name='Вклад в рейтинг'
+    )
+
+    class Meta:
+        verbose_name = 'Событие рейтинга'
+        verbose_name_plural = 'События рейтинга'
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id}, {self.score}'
+
+
+class RecipeOutbox(models.Model):
+    """Модель описывающая публикацию рецепта, ещё не разосланную подписчикам.
+
+    Пишется в одной транзакции с рецептом; команда fanout раскладывает
+    рецепт по InboxItem подписчиков пачками и удаляет запись.
+    cursor - id последней обработанной подписки.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    cursor = models.BigIntegerField(
+        default=0,
+        verbose_name='Последняя обработанная подписка'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата публикации'
+    )
+
+    class Meta:
+        verbose_name = 'Рассылка рецепта'
+        verbose_name_plural = 'Рассылки рецептов'
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id}, {self.cursor}'
+
+
+class RecipeTombstone(models.Model):
+    """Модель описывающая удалённый рецепт для синхронизации клиентов."""
+
+    recipe_id = models.BigIntegerField(
+        verbose_name='Id рецепта'
+    )
+    deleted = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата удаления'
+    )
+
+    class Meta:
+        verbose_name = 'Удалённый рецепт'
+        verbose_name_plural = 'Удалённые рецепты'
+        indexes = [
+            models.Index(
+                fields=[
+                    'deleted',
+                    'id'
+                ],
+                name='recipetombstone_deleted_id_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id}, {self.deleted}'
+
+
+class BootstrapStep(models.Model):
+    """Модель описывающая отпечаток входных данных шага запуска."""
+
+    name = models.CharField(
+        max_length=MAX_LENGTH,
+        unique=True,
+        verbose_name='Шаг'
+    )
+    fingerprint = models.CharField(
+        max_length=64,
+        verbose_name='Отпечаток'
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата выполнения'
+    )
+
+    class Meta:
+        verbose_name = 'Шаг запуска'
+        verbose_name_plural = 'Шаги запуска'
+
+    def __str__(self) -> str:
+        return f'{self.name}, {self.fingerprint}'
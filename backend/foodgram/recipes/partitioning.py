@@ -0,0 +1,106 @@
+"""Секционирование таблиц избранного и корзины в PostgreSQL.
+
+Favorite и ShoppingCart делятся на секции по HASH(user_id): проверки
+Exists(user=..., recipe=...) в ленте отсекают все секции, кроме
+одной, а VACUUM и перестроение индексов идут по небольшим секциям.
+Уникальность %(class)s_unique по (recipe, user) содержит ключ
+секционирования и переносится без изменений; первичный ключ
+секционированной таблицы - (id, user_id), id по-прежнему выдаётся
+одной последовательностью и уникален.
+"""
+
+PARTITION_KEY = 'user_id'
+
+
+def is_partitioned(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p '
+            'JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s)',
+            [table]
+        )
+        return cursor.fetchone()[0]
+
+
+def partition_names(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent '
+            'WHERE p.relname = %s ORDER BY c.relname',
+            [table]
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def rebuild_table(schema_editor, model, partitions):
+    """Пересоздаёт таблицу модели с данными, ключами и индексами.
+
+    partitions > 0 - секционированная по HASH(user_id) таблица из
+    partitions секций, 0 - обычная таблица. Таблица блокируется на
+    время копирования, поэтому на больших объёмах перестроение
+    запускают в окно обслуживания.
+    """
+    quote = schema_editor.quote_name
+    execute = schema_editor.execute
+    table = model._meta.db_table
+    old = f'{table}_old'
+    sequence = f'{table}_id_seq'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE'
+        )
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {quote(table)}')
+        last_id = cursor.fetchone()[0]
+    execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}')
+    for name in partition_names(schema_editor.connection, old):
+        execute(f'ALTER TABLE {quote(name)} RENAME TO {quote(f"{name}_old")}')
+    # Последовательность id создаётся заново и принадлежит новой таблице.
+    execute(
+        f'ALTER TABLE {quote(old)} ALTER COLUMN id DROP IDENTITY IF EXISTS'
+    )
+    execute(f'ALTER TABLE {quote(old)} ALTER COLUMN id DROP DEFAULT')
+    execute(f'DROP SEQUENCE IF EXISTS {quote(sequence)}')
+    execute(
+        f'CREATE TABLE {quote(table)} (LIKE {quote(old)})'
+        + (f' PARTITION BY HASH ({PARTITION_KEY})' if partitions else '')
+    )
+    execute(f'CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id')
+    execute(
+        f'ALTER TABLE {quote(table)} ALTER COLUMN id '
+        f"SET DEFAULT nextval('{sequence}')"
+    )
+    execute('SELECT setval(%s, %s, false)', (sequence, last_id + 1))
+    for remainder in range(partitions):
+        execute(
+            f'CREATE TABLE {quote(f"{table}_p{remainder}")} '
+            f'PARTITION OF {quote(table)} '
+            f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+        )
+    execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old)}')
+    execute(f'DROP TABLE {quote(old)} CASCADE')
+    primary_key = ('id', PARTITION_KEY) if partitions else ('id',)
+    execute(
+        f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(f"{table}_pkey")} '
+        f'PRIMARY KEY ({", ".join(primary_key)})'
+    )
+    for field in model._meta.concrete_fields:
+        if not field.is_relation:
+            continue
+        column = field.column
+        target = field.remote_field.model._meta.db_table
+        execute(
+            f'ALTER TABLE {quote(table)} '
+            f'ADD CONSTRAINT {quote(f"{table}_{column}_fk")} '
+            f'FOREIGN KEY ({column}) REFERENCES {quote(target)} (id) '
+            'DEFERRABLE INITIALLY DEFERRED'
+        )
+        execute(
+            f'CREATE INDEX {quote(f"{table}_{column}_idx")} '
+            f'ON {quote(table)} ({column})'
+        )
+    for constraint in model._meta.constraints:
+        schema_editor.add_constraint(model, constraint)
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed,
+                                      post_delete,
+                                      post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from foodgram.cache import bump_version
+from foodgram.constants import MATCH_INDEX_VERSION
+from recipes.models import (Ingredient,
+                            IngredientForRecipe,
+                            Recipe,
+                            RecipeTombstone,
+                            Tag)
+
+RELATION_CHANGES = ('post_add', 'post_remove', 'post_clear')
+
+
+def touch_recipes(queryset):
+    """Сдвигает дату изменения рецептов для синхронизации клиентов."""
+    queryset.update(updated=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def touch_recipe_relations(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    """Связи рецепта изменены с любой стороны.
+
+    При очистке со стороны тэга или ингредиента id рецептов не
+    передаются, поэтому рецепты находятся по связям до очистки.
+    """
+    if reverse and action == 'pre_clear':
+        field = 'tags' if sender is Recipe.tags.through else 'ingredients'
+        touch_recipes(Recipe.objects.filter(**{field: instance}))
+        return
+    if action not in RELATION_CHANGES:
+        return
+    if not reverse:
+        touch_recipes(Recipe.objects.filter(pk=instance.pk))
+    elif pk_set:
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=IngredientForRecipe)
+def touch_recipe_ingredient(instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(post_save, sender=Tag)
+def touch_tag_recipes(instance, created, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def touch_deleted_ingredient_recipes(instance, **kwargs):
+    """Связи удаляются каскадом, рецепты отмечаются до удаления."""
+    touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(pre_delete, sender=Tag)
+def touch_deleted_tag_recipes(instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_delete, sender=Recipe)
+def bury_recipe(instance, **kwargs):
+    RecipeTombstone.objects.create(recipe_id=instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientForRecipe)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_ingredient_index(**kwargs):
+    """Индекс подбора перестраивается после фиксации транзакции."""
+    transaction.on_commit(lambda: bump_version(MATCH_INDEX_VERSION))
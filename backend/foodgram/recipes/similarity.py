@@ -0,0 +1,159 @@
+"""Индекс похожих рецептов по ингредиентам и тэгам."""
+import os
+import threading
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+
+from foodgram.constants import SIMILAR_RECIPES_LIMIT, SIMILARITY_BATCH_SIZE
+from recipes.models import IngredientForRecipe, Recipe
+
+
+def _expand_ranges(starts, lengths):
+    """Склеивает диапазоны [start, start + length) в один массив индексов."""
+    total = lengths.sum()
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + np.arange(total) - offsets
+
+
+def _load_pairs():
+    """Пары (рецепт, признак): ингредиенты - чётные, тэги - нечётные."""
+    ingredients = np.fromiter(
+        chain.from_iterable(
+            IngredientForRecipe.objects.values_list(
+                'recipe_id',
+                'ingredients_id'
+            ).iterator(chunk_size=10000)
+        ),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    tags = np.fromiter(
+        chain.from_iterable(
+            Recipe.tags.through.objects.values_list(
+                'recipe_id',
+                'tag_id'
+            ).iterator(chunk_size=10000)
+        ),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    ingredients[:, 1] *= 2
+    tags[:, 1] = tags[:, 1] * 2 + 1
+    return np.concatenate((ingredients, tags))
+
+
+def build_similarity_index(limit=SIMILAR_RECIPES_LIMIT,
+                           batch_size=SIMILARITY_BATCH_SIZE):
+    """Считает top-k соседей каждого рецепта по косинусной мере TF-IDF.
+
+    Матрица признаков хранится разреженно: по строкам (рецепты) и по
+    столбцам (признаки). Для пачки рецептов скалярные произведения со
+    всеми рецептами собираются через bincount по спискам рецептов
+    каждого признака, без плотной матрицы всего каталога.
+    """
+    pairs = _load_pairs()
+    recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    _, cols = np.unique(pairs[:, 1], return_inverse=True)
+    size = len(recipe_ids)
+    idf = np.log((1 + size) / (1 + np.bincount(cols))) + 1
+    weights = idf[cols]
+    weights /= np.sqrt(np.bincount(rows, weights=weights ** 2))[rows]
+
+    by_row = np.lexsort((cols, rows))
+    row_ptr = np.searchsorted(rows[by_row], np.arange(size + 1))
+    by_col = np.argsort(cols, kind='stable')
+    col_ptr = np.searchsorted(
+        cols[by_col],
+        np.arange(cols.max(initial=-1) + 2)
+    )
+    col_rows = rows[by_col]
+    col_weights = weights[by_col]
+
+    limit = min(limit, max(size - 1, 0))
+    index = np.zeros(
+        size,
+        dtype=[
+            ('id', np.int64),
+            ('neighbours', np.int64, (limit,)),
+            ('scores', np.float32, (limit,)),
+        ]
+    )
+    index['id'] = recipe_ids
+    index['neighbours'] = -1
+    for start in range(0, size, batch_size):
+        stop = min(start + batch_size, size)
+        entries = by_row[row_ptr[start]:row_ptr[stop]]
+        lengths = col_ptr[cols[entries] + 1] - col_ptr[cols[entries]]
+        postings = _expand_ranges(col_ptr[cols[entries]], lengths)
+        local = np.repeat(rows[entries] - start, lengths)
+        scores = np.bincount(
+            local * size + col_rows[postings],
+            weights=np.repeat(weights[entries], lengths)
+            * col_weights[postings],
+            minlength=(stop - start) * size
+        ).reshape(stop - start, size)
+        batch = np.arange(stop - start)
+        scores[batch, batch + start] = -1
+        if not limit:
+            continue
+        top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        neighbours = recipe_ids[top]
+        neighbours[top_scores <= 0] = -1
+        index['neighbours'][start:stop] = neighbours
+        index['scores'][start:stop] = top_scores
+    return index
+
+
+def save_similarity_index(index, path=None):
+    """Атомарно заменяет файл индекса, чтобы воркеры не прочли его частично."""
+    path = path or settings.SIMILARITY_INDEX_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.save(file, index)
+    os.replace(tmp_path, path)
+
+
+class SimilarityIndex:
+    """Индекс, отображённый в память только для чтения.
+
+    Страницы файла делятся между всеми воркерами через page cache ОС.
+    Файл переоткрывается, когда команда build_similarity_index
+    подменяет его новым.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._index = np.load(self.path, mmap_mode='r')
+                    self._mtime = mtime
+        return self._index
+
+    def similar(self, recipe_id):
+        """Id похожих рецептов в порядке убывания сходства."""
+        index = self._load()
+        if index is None or not len(index):
+            return []
+        position = np.searchsorted(index['id'], recipe_id)
+        if position >= len(index) or index['id'][position] != recipe_id:
+            return []
+        neighbours = index['neighbours'][position]
+        return neighbours[neighbours >= 0].tolist()
+
+
+similarity_index = SimilarityIndex(settings.SIMILARITY_INDEX_PATH)
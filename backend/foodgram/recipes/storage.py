@@ -0,0 +1,53 @@
+"""Хранилище картинок рецептов с именами по содержимому."""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файл называется sha256 своего содержимого.
+
+    Повторная загрузка той же картинки не создаёт копию, а отдаёт
+    имя уже сохранённого файла. URL меняется вместе с содержимым,
+    поэтому такие файлы можно кэшировать навсегда. Файлы, на которые
+    не ссылается ни один рецепт, удаляет команда collect_media.
+    """
+
+    @staticmethod
+    def content_name(name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        hexdigest = digest.hexdigest()
+        return os.path.join(
+            directory,
+            hexdigest[:2],
+            f'{hexdigest}{extension}'
+        )
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Свежий mtime не даёт collect_media удалить файл,
+            # пока рецепт с повторной загрузкой ещё не сохранён.
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                pass
+        # При гонке двух одинаковых загрузок FileSystemStorage
+        # сохранит вторую под именем с суффиксом.
+        return super()._save(name, content)
+
+
+image_storage = ContentAddressedStorage()
+
+
+def get_image_storage():
+    return image_storage
@@ -0,0 +1,440 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from foodgram.benchmarks import SCENARIOS
+from foodgram.cache import get_version
+from recipes.models import (BootstrapStep,
+                            Favorite,
+                            Ingredient,
+                            IngredientForRecipe,
+                            Recipe,
+                            RecipeScore,
+                            RecipeTombstone,
+                            ShoppingCart,
+                            Tag,
+                            TrendingEvent)
+from recipes.partitioning import is_partitioned, partition_names
+from recipes.storage import ContentAddressedStorage
+from recipes.trending import record_event
+from users.models import Subscribe, User
+
+SEQUENTIAL_SCAN = re.compile(r'Seq Scan on \S+|\bSCAN \S+$', re.MULTILINE)
+FULL_INDEX_SCAN = re.compile(
+    r'\bSCAN \S+ USING (COVERING )?INDEX',
+    re.MULTILINE
+)
+
+
+class HotQueryPlanTests(TestCase):
+    """Горячие запросы читают таблицы по индексам.
+
+    В PostgreSQL последовательное сканирование отключается, чтобы
+    на маленькой тестовой БД планировщик выбрал индекс, если он есть.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user',
+            email='user@example.com',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user,
+            name='Рецепт',
+            image='recipe.png',
+            text='Описание',
+            cooking_time=10
+        )
+
+    def hot_queries(self):
+        user, recipe = self.user, self.recipe
+        return {
+            'лента рецептов': Recipe.objects.order_by(
+                '-created', '-id'
+            )[:6],
+            'рецепты автора': Recipe.objects.filter(
+                author=recipe.author_id
+            ).order_by('-created')[:6],
+            'is_favorited': Favorite.objects.filter(
+                user=user,
+                recipe=recipe
+            ),
+            'is_in_shopping_cart': ShoppingCart.objects.filter(
+                user=user,
+                recipe=recipe
+            ),
+            'избранное пользователя': Favorite.objects.filter(user=user),
+            'ингредиенты рецептов': IngredientForRecipe.objects.filter(
+                recipe__in=(recipe.pk,)
+            ).values('recipe', 'ingredients', 'amount'),
+            'подписчики автора': Subscribe.objects.filter(
+                author=recipe.author_id
+            ),
+            'подписки пользователя': Subscribe.objects.filter(user=user),
+        }
+
+    def test_hot_queries_use_indexes(self):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in self.hot_queries().items():
+                plan = queryset.explain()
+                with self.subTest(name):
+                    self.assertIsNone(SEQUENTIAL_SCAN.search(plan), plan)
+                    # Полный проход по индексу допустим только с LIMIT.
+                    if not queryset.query.is_sliced:
+                        self.assertIsNone(
+                            FULL_INDEX_SCAN.search(plan),
+                            plan
+                        )
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.storage = ContentAddressedStorage(location=location)
+
+    def test_duplicate_upload_refreshes_mtime(self):
+        name = self.storage.save('recipes/a.png', ContentFile(b'image'))
+        path = self.storage.path(name)
+        old = time.time() - 3600
+        os.utime(path, (old, old))
+        self.assertEqual(
+            self.storage.save('recipes/b.png', ContentFile(b'image')),
+            name
+        )
+        self.assertGreater(os.stat(path).st_mtime, old + 60)
+
+
+class CleanSpoolTests(TestCase):
+
+    def setUp(self):
+        spool_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_root)
+        settings = self.settings(SPOOL_ROOT=spool_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.paths = {}
+        for name, age in (('ab/old', 7200), ('cd/fresh', 0)):
+            path = os.path.join(spool_root, name)
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as file:
+                file.write(b'list')
+            mtime = time.time() - age
+            os.utime(path, (mtime, mtime))
+            self.paths[name] = path
+
+    def test_removes_only_stale_files(self):
+        call_command('clean_spool', max_age=3600, stdout=StringIO())
+        self.assertFalse(os.path.exists(self.paths['ab/old']))
+        self.assertTrue(os.path.exists(self.paths['cd/fresh']))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Секции есть в PostgreSQL')
+class PartitionRecipeUserTests(TestCase):
+    """Перестроение таблиц сохраняет строки, ключи и уникальность."""
+
+    models = (Favorite, ShoppingCart)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия'
+            )
+            for number in range(3)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.users[0],
+                name=f'Рецепт {number}',
+                image='recipe.png',
+                text='Описание',
+                cooking_time=10
+            )
+            for number in range(2)
+        ]
+        for model in cls.models:
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for user in cls.users[:2]
+                for recipe in cls.recipes
+            )
+
+    def assert_rebuilt(self, model, partitions, rows, recipe):
+        table = model._meta.db_table
+        self.assertEqual(is_partitioned(connection, table), bool(partitions))
+        self.assertEqual(len(partition_names(connection, table)), partitions)
+        self.assertEqual(model.objects.count(), rows)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            model.objects.create(user=self.users[0], recipe=self.recipes[0])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            model.objects.create(user_id=self.users[0].pk, recipe_id=0)
+            connection.check_constraints()
+        last = model.objects.order_by('-id').first().pk
+        created = model.objects.create(user=self.users[2], recipe=recipe)
+        self.assertGreater(created.pk, last)
+        return rows + 1
+
+    def test_partition_and_revert(self):
+        rows = {model: model.objects.count() for model in self.models}
+        for recipe, partitions in zip(self.recipes, (4, 0)):
+            call_command(
+                'partition_recipe_user',
+                partitions=partitions,
+                stdout=StringIO()
+            )
+            for model in self.models:
+                with self.subTest(model=model.__name__, partitions=partitions):
+                    rows[model] = self.assert_rebuilt(
+                        model,
+                        partitions,
+                        rows[model],
+                        recipe
+                    )
+
+
+class TrendingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author',
+            email='author@example.com',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                image='recipe.png',
+                text='Описание',
+                cooking_time=10
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def flush(self, **options):
+        call_command('flush_trending', stdout=StringIO(), **options)
+
+    def test_events_are_queued_until_flush(self):
+        first, second, _ = self.recipes
+        for user_id in (1, 2, 3):
+            record_event('favorite', user_id, first.pk)
+        record_event('favorite', 1, first.pk)
+        record_event('shoppingcart', 1, second.pk)
+        self.assertEqual(TrendingEvent.objects.count(), 4)
+        self.assertFalse(RecipeScore.objects.exists())
+        self.flush(batch_size=3)
+        self.assertFalse(TrendingEvent.objects.exists())
+        scores = dict(RecipeScore.objects.values_list('recipe', 'score'))
+        self.assertEqual(set(scores), {first.pk, second.pk})
+        self.assertGreater(scores[first.pk], scores[second.pk])
+
+    def test_flush_adds_to_existing_score(self):
+        recipe = self.recipes[0]
+        record_event('favorite', 1, recipe.pk)
+        self.flush()
+        before = RecipeScore.objects.get(recipe=recipe).score
+        record_event('favorite', 2, recipe.pk)
+        self.flush()
+        self.assertGreater(
+            RecipeScore.objects.get(recipe=recipe).score,
+            before
+        )
+
+
+class LoadCsvTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_load_invalidates_reference_cache(self):
+        versions = [
+            get_version(f'reference:{prefix}')
+            for prefix in ('ingredients', 'tags')
+        ]
+        call_command('load_csv', stdout=StringIO())
+        self.assertTrue(Ingredient.objects.exists())
+        self.assertTrue(Tag.objects.exists())
+        self.assertEqual(
+            [
+                get_version(f'reference:{prefix}')
+                for prefix in ('ingredients', 'tags')
+            ],
+            [version + 1 for version in versions]
+        )
+
+
+class RecipeChangeSignalsTests(TestCase):
+    """Изменения связей сдвигают Recipe.updated для /changes/."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author',
+            email='author@example.com',
+            first_name='Имя',
+            last_name='Фамилия'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E', slug='b')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль',
+            measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            image='recipe.png',
+            text='Описание',
+            cooking_time=10
+        )
+        cls.recipe.tags.add(cls.tag)
+        IngredientForRecipe.objects.create(
+            recipe=cls.recipe,
+            ingredients=cls.ingredient,
+            amount=1
+        )
+
+    def setUp(self):
+        self.old = timezone.now() - timedelta(days=1)
+        Recipe.objects.update(updated=self.old)
+
+    def assert_touched(self):
+        self.recipe.refresh_from_db()
+        self.assertGreater(self.recipe.updated, self.old)
+
+    def test_reverse_tag_clear(self):
+        self.tag.tags.clear()
+        self.assert_touched()
+
+    def test_reverse_ingredient_clear(self):
+        self.ingredient.recipe_set.clear()
+        self.assert_touched()
+
+    def test_ingredient_delete(self):
+        self.ingredient.delete()
+        self.assert_touched()
+
+    def test_tag_delete(self):
+        self.tag.delete()
+        self.assert_touched()
+
+    def test_recipe_delete_leaves_tombstone(self):
+        pk = self.recipe.pk
+        self.recipe.delete()
+        self.assertTrue(RecipeTombstone.objects.filter(recipe_id=pk).exists())
+
+
+class BootstrapTests(TestCase):
+    """Шаги bootstrap с неизменившимися входными данными пропускаются."""
+
+    def setUp(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        settings = self.settings(STATIC_ROOT=static_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch(
+            'recipes.management.commands.bootstrap.call_command'
+        )
+        self.call_command = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def bootstrap(self, **options):
+        self.call_command.reset_mock()
+        call_command('bootstrap', stdout=StringIO(), **options)
+        return [call.args[0] for call in self.call_command.call_args_list]
+
+    def test_second_run_skips_everything(self):
+        self.assertEqual(self.bootstrap(), ['load_csv', 'collectstatic'])
+        self.assertEqual(self.bootstrap(), [])
+
+    def test_changed_seed_reloads_data(self):
+        self.bootstrap()
+        BootstrapStep.objects.filter(name='seed').update(fingerprint='old')
+        self.assertEqual(self.bootstrap(), ['load_csv'])
+
+    def test_force_runs_every_step(self):
+        self.bootstrap()
+        self.assertEqual(
+            self.bootstrap(force=True),
+            ['migrate', 'load_csv', 'collectstatic']
+        )
+
+
+class BenchmarkScenarioTests(TestCase):
+    """Сценарии benchmark выполняются на минимальном объёме данных."""
+
+    def run_scenario(self, name):
+        run, _ = SCENARIOS[name]
+        lines = list(run(1, 0.001))
+        self.assertTrue(lines)
+        return lines
+
+    def test_feed(self):
+        self.run_scenario('feed')
+
+    def test_match(self):
+        self.run_scenario('match')
+
+    def test_serializer(self):
+        self.run_scenario('serializer')
+
+    def test_json(self):
+        self.run_scenario('json')
+
+    def test_compression(self):
+        self.run_scenario('compression')
+
+    def test_boot(self):
+        self.run_scenario('boot')
+
+    def test_fields(self):
+        self.run_scenario('fields')
+
+    @skipUnless(connection.vendor != 'postgresql', 'Проверка для SQLite')
+    def test_partitions_require_postgresql(self):
+        with self.assertRaises(CommandError):
+            self.run_scenario('partitions')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Секции есть в PostgreSQL')
+class PartitionsBenchmarkTests(TransactionTestCase):
+    """VACUUM не выполняется в транзакции, поэтому без TestCase."""
+
+    def test_partitions(self):
+        self.addCleanup(
+            call_command,
+            'partition_recipe_user',
+            partitions=0,
+            stdout=StringIO()
+        )
+        run, _ = SCENARIOS['partitions']
+        self.assertTrue(list(run(1, 0.001)))
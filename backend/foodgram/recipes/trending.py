@@ -0,0 +1,89 @@
+"""Рейтинг популярных рецептов с затуханием по времени."""
+import math
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from foodgram.constants import TRENDING_HALF_LIFE, TRENDING_WEIGHTS
+from recipes.models import RecipeScore, TrendingEvent
+
+DEDUPE_KEY = 'trending:{kind}:{user}:{recipe}'
+
+
+def event_score(weight, timestamp):
+    """Вклад события в score: log(weight * 2 ** (t / T))."""
+    return math.log(weight) + timestamp / TRENDING_HALF_LIFE * math.log(2)
+
+
+def add_scores(first, second):
+    """log(e ** first + e ** second) без переполнения."""
+    high, low = max(first, second), min(first, second)
+    if low == -math.inf:
+        return high
+    return high + math.log1p(math.exp(low - high))
+
+
+def flush_events(batch_size):
+    """Сворачивает пачку событий в RecipeScore.
+
+    Вклады событий одного рецепта складываются в памяти, строки
+    RecipeScore, которых ещё нет, вставляются с нулевым вкладом,
+    после чего все строки пачки блокируются и обновляются. События
+    выбираются с SKIP LOCKED, поэтому несколько процессов сброса
+    не учитывают одно событие дважды. Возвращает число событий,
+    None - очередь пуста.
+    """
+    with transaction.atomic():
+        events = list(
+            TrendingEvent.objects.select_for_update(
+                skip_locked=True
+            ).order_by('pk')[:batch_size]
+        )
+        if not events:
+            return None
+        pending = {}
+        for event in events:
+            pending[event.recipe_id] = add_scores(
+                pending.get(event.recipe_id, -math.inf),
+                event.score
+            )
+        now = timezone.now()
+        RecipeScore.objects.bulk_create(
+            [
+                RecipeScore(recipe_id=pk, score=-math.inf, updated=now)
+                for pk in pending
+            ],
+            ignore_conflicts=True
+        )
+        scores = list(
+            RecipeScore.objects.select_for_update().filter(
+                recipe__in=pending
+            ).order_by('pk')
+        )
+        for row in scores:
+            row.score = add_scores(row.score, pending[row.recipe_id])
+            row.updated = now
+        RecipeScore.objects.bulk_update(scores, ('score', 'updated'))
+        TrendingEvent.objects.filter(
+            pk__in=[event.pk for event in events]
+        ).delete()
+    return len(events)
+
+
+def record_event(kind, user_id, recipe_id):
+    """Учитывает добавление рецепта в избранное или корзину.
+
+    Событие записывается в TrendingEvent и попадает в рейтинг
+    после запуска flush_trending. Повторное добавление тем же
+    пользователем в течение периода полураспада (удалил и добавил
+    снова) не накручивает рейтинг.
+    """
+    key = DEDUPE_KEY.format(kind=kind, user=user_id, recipe=recipe_id)
+    if not cache.add(key, 1, TRENDING_HALF_LIFE):
+        return
+    TrendingEvent.objects.create(
+        recipe_id=recipe_id,
+        score=event_score(TRENDING_WEIGHTS[kind], time.time())
+    )
@@ -0,0 +1,61 @@
+"""Приведение количеств ингредиентов к единым единицам измерения."""
+import csv
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+
+UNITS_FILE = 'units.csv'
+
+
+@lru_cache(maxsize=None)
+def load_unit_conversions():
+    """Таблица пересчёта, читается один раз на процесс.
+
+    Ключ - (ингредиент, единица), для общих правил ингредиент пустой,
+    значение - (каноническая единица, множитель).
+    """
+    conversions = {}
+    path = settings.BASE_DIR / 'data' / UNITS_FILE
+    with open(path, 'r', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            conversions[(row['ingredient'], row['unit'])] = (
+                row['canonical_unit'],
+                float(row['factor'])
+            )
+    return conversions
+
+
+def _format_amount(amount):
+    amount = round(amount, 2)
+    return int(amount) if amount.is_integer() else amount
+
+
+def normalize_amounts(rows):
+    """Сводит строки (название, единица, количество) к каноническим единицам.
+
+    Количества пересчитываются одним векторным умножением, строки
+    одного ингредиента с совпавшей канонической единицей складываются.
+    """
+    conversions = load_unit_conversions()
+    keys = {}
+    positions = []
+    factors = []
+    amounts = []
+    for name, unit, amount in rows:
+        canonical_unit, factor = conversions.get(
+            (name, unit),
+            conversions.get(('', unit), (unit, 1.0))
+        )
+        positions.append(keys.setdefault((name, canonical_unit), len(keys)))
+        factors.append(factor)
+        amounts.append(amount)
+    totals = np.bincount(
+        np.array(positions, dtype=np.int64),
+        weights=np.array(amounts, dtype=np.float64) * np.array(factors),
+        minlength=len(keys)
+    )
+    return sorted(
+        (name, unit, _format_amount(total))
+        for (name, unit), total in zip(keys, totals.tolist())
+    )
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.5 on 2026-10-19 12:40
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """GIN-индексы pg_trgm для LIKE '%...%' по LOWER(поле).
+
+    Только для PostgreSQL; в SQLite поиск идёт полным просмотром.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS users_user_{field}_trgm_idx '
+            f'ON users_user USING gin (LOWER({field}) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS users_user_{field}_trgm_idx'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_inboxitem'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('username'), models.F('id'), name='user_username_lower_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
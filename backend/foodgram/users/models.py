@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
 
 from foodgram.constants import MAX_LENGTH_EMAIL, MAX_LENGTH_PERSONAL
 
@@ -26,6 +27,10 @@ class User(AbstractUser):
         verbose_name='Фамилия',
         help_text='Введите вашу фамилию'
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
 
     LOGIN_FIELDS = ('email',)
     USERNAME_FIELD = 'email'
@@ -35,6 +40,13 @@ class User(AbstractUser):
         ordering = ('email',)
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            models.Index(
+                Lower('username'),
+                'id',
+                name='user_username_lower_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.username
@@ -70,6 +82,61 @@ class Subscribe(models.Model):
                 check=~models.Q(user=models.F('author')),
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=[
+                    'author',
+                    'id'
+                ],
+                name='subscribe_author_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
+
+
+class InboxItem(models.Model):
+    """Модель описывающая новый рецепт автора в ленте подписчика."""
+
+    user = models.ForeignKey(
+        User,
+        related_name='inbox',
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        'recipes.Recipe',
+        related_name='+',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата доставки'
+    )
+
+    class Meta:
+        verbose_name = 'Уведомление'
+        verbose_name_plural = 'Уведомления'
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'user',
+                    'recipe',
+                ],
+                name='unique_inbox_item'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=[
+                    'user',
+                    '-id'
+                ],
+                name='inboxitem_user_id_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe_id}'
@@ -1,6 +1,8 @@
 #! /bin/bash
-python manage.py makemigrations;
-python manage.py migrate;
-python manage.py load_csv ingredients.csv;
-python manage.py collectstatic --noinput;
-gunicorn -b 0:8000 foodgram.wsgi;
\ No newline at end of file
+if [ -n "$DB_HOST" ]; then
+    until nc -z "$DB_HOST" "${DB_PORT:-5432}"; do sleep 1; done;
+fi
+python manage.py check --deploy --fail-level ERROR || exit 1;
+python manage.py bootstrap || exit 1;
+python manage.py build_similarity_index;
+exec gunicorn -c gunicorn.conf.py foodgram.wsgi;